@@ -1,15 +1,16 @@
 import streamlit as st
 import cv2
 import numpy as np
-from PIL import Image
 import pandas as pd
 import matplotlib.pyplot as plt
-from utils.image_processing import ImageProcessor
+from utils.image_processing import ImageProcessor, open_image, COLOR_DECODE_SIZE, THUMBNAIL_DECODE_SIZE
 from utils.color_analysis import ColorAnalyzer
 from utils.outfit_matcher import OutfitMatcher
 from utils.style_matcher import StyleMatcher
 from utils.clip_analyzer import CLIPAnalyzer
 from utils.image_loader import ImageLoader
+from utils.palette_store import CatalogPaletteStore, attach_palettes
+from utils.catalog import CompiledCatalog
 from data.sample_clothing import get_sample_clothing_data
 import io
 
@@ -37,22 +38,35 @@ def load_processors():
     color_analyzer = ColorAnalyzer()
     outfit_matcher = OutfitMatcher()
     style_matcher = StyleMatcher()
-    clip_analyzer = CLIPAnalyzer()
+    # The CLIP model loads in a background thread so the first render is not blocked
+    clip_analyzer = CLIPAnalyzer(background_load=True)
     return image_processor, color_analyzer, outfit_matcher, style_matcher, clip_analyzer
 
-@st.cache_data
-def load_clothing_data():
-    """Load clothing data from local images or fallback to sample data"""
+@st.cache_resource(max_entries=1)
+def load_clothing_data(products_fingerprint):
+    """
+    Load clothing data from local images or fallback to sample data, compiled for the matchers.
+    products_fingerprint keys the cache, so adding or changing product images rebuilds the catalog.
+    """
     image_loader = ImageLoader()
     
     # Try to load from local products directory first
     local_data = image_loader.load_products_from_directory()
     
     if not local_data.empty:
-        return local_data
+        # Real colour palettes stored by tools/ingest_palettes; images not ingested yet
+        # are matched by the colour in their filename
+        palette_store = CatalogPaletteStore()
+        missing = palette_store.missing(local_data['image_url'].tolist())
+        if missing:
+            print(f"{len(missing)} product images have no stored palette yet. "
+                  f"Run 'python -m tools.ingest_palettes' to extract them.")
+        products = attach_palettes(local_data, palette_store)
     else:
         # Fallback to sample data if no local images
-        return get_sample_clothing_data()
+        products = get_sample_clothing_data()
+    
+    return CompiledCatalog(products)
 
 def main():
     st.title("🎨 AI-Powered Fashion Stylist")
@@ -60,12 +74,15 @@ def main():
     
     # Load components
     image_processor, color_analyzer, outfit_matcher, style_matcher, clip_analyzer = load_processors()
-    clothing_data = load_clothing_data()
     image_loader = ImageLoader()
     
-    # Initialize CLIP model
-    with st.spinner("Caricamento modello CLIP LAION..."):
-        clip_ready = clip_analyzer.initialize()
+    # The analyzer is cached across reruns, so retry a background load that failed
+    if clip_analyzer.load_error is not None and not clip_analyzer.is_loading():
+        clip_analyzer.start_background_initialize()
+    catalog = load_clothing_data(image_loader.products_fingerprint())
+    
+    # CLIP is usable if it is loaded or still loading in the background
+    clip_ready = clip_analyzer.is_ready() or clip_analyzer.is_loading()
     
     # Sidebar for controls
     with st.sidebar:
@@ -116,12 +133,18 @@ def main():
         )
         
         use_clip = algorithm_mode == "AI Avanzato" and clip_ready
+        if use_clip and not clip_analyzer.is_ready():
+            st.caption("⏳ Modello CLIP LAION in caricamento...")
         use_style_references = algorithm_mode == "Riferimenti di stile"
+        joint_optimization = st.checkbox(
+            "Ottimizzazione congiunta",
+            help="Sceglie i capi insieme, premiando gli abbinamenti di colore armoniosi tra di loro (algoritmo base)"
+        )
         
         if st.button("🔍 Analizza e Ricostruisci", disabled=st.session_state.uploaded_image is None):
             analyze_and_reconstruct(image_processor, color_analyzer, outfit_matcher, style_matcher, clip_analyzer,
-                                  clothing_data, image_loader, color_clusters, match_threshold, 
-                                  use_clip, use_style_references)
+                                  catalog, image_loader, color_clusters, match_threshold, 
+                                  use_clip, use_style_references, joint_optimization)
         
         # Image management section
         st.header("📁 Gestione Immagini")
@@ -147,9 +170,9 @@ def main():
         if st.session_state.uploaded_image is not None:
             # Load image based on source
             if st.session_state.get('image_source') == 'local':
-                image = image_loader.get_image_from_path(st.session_state.uploaded_image)
+                image = image_loader.get_image_from_path(st.session_state.uploaded_image, draft_size=COLOR_DECODE_SIZE)
             else:
-                image = Image.open(st.session_state.uploaded_image)
+                image = open_image(st.session_state.uploaded_image, draft_size=COLOR_DECODE_SIZE)
             
             if image:
                 st.image(image, caption="Look di Ispirazione", use_column_width=True)
@@ -171,31 +194,39 @@ def main():
     
     # Available clothing items
     st.header("👕 Indumenti Disponibili")
-    show_clothing_inventory(clothing_data, image_loader)
+    show_clothing_inventory(catalog, image_loader)
 
 def analyze_and_reconstruct(image_processor, color_analyzer, outfit_matcher, style_matcher, clip_analyzer,
-                          clothing_data, image_loader, color_clusters, match_threshold, 
-                          use_clip, use_style_references):
+                          catalog, image_loader, color_clusters, match_threshold, 
+                          use_clip, use_style_references, joint_optimization=False):
     """Analyze the uploaded image and reconstruct the outfit"""
     
     with st.spinner("🧠 L'AI sta analizzando il look di ispirazione..."):
         # Load and process image
         if st.session_state.get('image_source') == 'local':
             image_loader = ImageLoader()
-            image = image_loader.get_image_from_path(st.session_state.uploaded_image)
+            image = image_loader.get_image_from_path(st.session_state.uploaded_image, draft_size=COLOR_DECODE_SIZE)
         else:
-            image = Image.open(st.session_state.uploaded_image)
+            image = open_image(st.session_state.uploaded_image, draft_size=COLOR_DECODE_SIZE)
         
         if not image:
             st.error("Errore nel caricamento dell'immagine")
             return
         
-        # Extract colors
-        colors = color_analyzer.extract_dominant_colors(image, n_colors=color_clusters)
+        # Extract colors (the palette is cached, so show_color_analysis reuses it)
+        palette = color_analyzer.extract_palette(image, n_colors=color_clusters, method='fast')
+        colors = palette.colors
         
         # Analyze style patterns
         style_features = image_processor.extract_style_features(image)
         
+        # Wait for the background CLIP load only when the AI mode actually needs it
+        if use_clip and not clip_analyzer.is_ready():
+            with st.spinner("Caricamento modello CLIP LAION..."):
+                if not clip_analyzer.wait_ready():
+                    st.warning("⚠️ Modello CLIP non disponibile. Usando algoritmo base.")
+                    use_clip = False
+        
         # Match clothing items
         if use_clip:
             # Use CLIP AI analysis
@@ -206,7 +237,7 @@ def analyze_and_reconstruct(image_processor, color_analyzer, outfit_matcher, sty
             st.info(f"🎨 Analisi AI: {semantic_desc}")
             
             # Find matches using CLIP
-            clothing_list = clothing_data.to_dict('records')
+            clothing_list = catalog.products.to_dict('records')
             clip_matches = clip_analyzer.find_best_clothing_matches(
                 image, clothing_list, threshold=match_threshold
             )
@@ -239,22 +270,20 @@ def analyze_and_reconstruct(image_processor, color_analyzer, outfit_matcher, sty
             
             if style_references:
                 matched_outfit, best_reference = style_matcher.find_best_matches_with_references(
-                    colors, style_features, clothing_data, style_references, threshold=match_threshold
+                    colors, style_features, catalog, style_references, threshold=match_threshold
                 )
                 st.session_state.best_reference = best_reference
                 st.info(f"🎯 Stile di riferimento rilevato: {best_reference['data']['name'] if best_reference else 'Nessuno'}")
             else:
                 # Fallback to basic matching if no references
-                matched_outfit = outfit_matcher.find_best_matches(
-                    colors, style_features, clothing_data, threshold=match_threshold
-                )
+                matched_outfit = match_basic(outfit_matcher, colors, style_features, catalog,
+                                             match_threshold, joint_optimization)
                 st.session_state.best_reference = None
                 st.warning("⚠️ Nessun riferimento di stile trovato. Usando algoritmo base.")
         else:
             # Use basic matching
-            matched_outfit = outfit_matcher.find_best_matches(
-                colors, style_features, clothing_data, threshold=match_threshold
-            )
+            matched_outfit = match_basic(outfit_matcher, colors, style_features, catalog,
+                                         match_threshold, joint_optimization)
             st.session_state.best_reference = None
         
         st.session_state.reconstructed_outfit = matched_outfit
@@ -263,11 +292,23 @@ def analyze_and_reconstruct(image_processor, color_analyzer, outfit_matcher, sty
     st.success("✅ Analisi completata! Controlla l'outfit ricostruito.")
     st.rerun()
 
+def match_basic(outfit_matcher, colors, style_features, catalog, match_threshold, joint_optimization):
+    """Basic colour and style matching, per category or jointly over the whole outfit"""
+    if joint_optimization:
+        return outfit_matcher.find_best_matches_joint(
+            colors, style_features, catalog, threshold=match_threshold
+        )
+    return outfit_matcher.find_best_matches(
+        colors, style_features, catalog, threshold=match_threshold
+    )
+
 def show_color_analysis(image, color_analyzer, n_colors):
     """Display color analysis results"""
     st.subheader("🎨 Color Analysis")
     
-    colors = color_analyzer.extract_dominant_colors(image, n_colors=n_colors)
+    # Cached from analyze_and_reconstruct, so reruns do not re-cluster the image
+    palette = color_analyzer.extract_palette(image, n_colors=n_colors, method='fast')
+    colors = palette.colors
     
     # Create color palette visualization
     fig, ax = plt.subplots(1, 1, figsize=(8, 2))
@@ -280,7 +321,7 @@ def show_color_analysis(image, color_analyzer, n_colors):
     ax.set_xlim(0, len(colors))
     ax.set_ylim(0, 1)
     ax.set_xticks(range(len(colors)))
-    ax.set_xticklabels([f"Color {i+1}" for i in range(len(colors))], rotation=45)
+    ax.set_xticklabels([f"Color {i+1}\n{weight:.0%}" for i, weight in enumerate(palette.weights)], rotation=45)
     ax.set_title("Dominant Colors")
     ax.set_aspect('equal')
     
@@ -322,11 +363,11 @@ def show_reconstructed_outfit(reconstructed_outfit):
                     
                     st.write(f"**Descrizione:** {item['description']}")
 
-def show_clothing_inventory(clothing_data, image_loader):
+def show_clothing_inventory(catalog, image_loader):
     """Display available clothing items in a grid"""
     
     # Group by category
-    categories = clothing_data['category'].unique()
+    categories = list(catalog.category_slices)
     category_names = {
         'shirt': 'Camicie',
         'pants': 'Pantaloni', 
@@ -338,7 +379,7 @@ def show_clothing_inventory(clothing_data, image_loader):
     for category in categories:
         st.subheader(f"{category_names.get(category, category.title())}")
         
-        items = clothing_data[clothing_data['category'] == category]
+        items = catalog.products.iloc[catalog.category_slice(category)]
         
         # Create columns for grid layout
         cols = st.columns(min(4, len(items)))
@@ -347,7 +388,7 @@ def show_clothing_inventory(clothing_data, image_loader):
             with cols[idx % 4]:
                 # Check if it's a local file
                 if item.get('local_file', False):
-                    image = image_loader.get_image_from_path(item['image_url'])
+                    image = image_loader.get_image_from_path(item['image_url'], draft_size=THUMBNAIL_DECODE_SIZE)
                     if image:
                         st.image(image, caption=item['name'], width=120)
                     else:
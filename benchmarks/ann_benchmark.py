@@ -0,0 +1,97 @@
+"""
+Compare approximate product search against exact search.
+
+Reports recall@k (fraction of the exact top-k found by the index) and mean
+query latency for each index setting. Runs on a synthetic clustered catalog
+by default, or on the stored catalog matrix with --catalog.
+
+Usage:
+    python -m benchmarks.ann_benchmark --size 200000 --k 10 --n-probe 1 4 8 16 32
+    python -m benchmarks.ann_benchmark --catalog --kind hnsw --ef-search 32 64 128
+"""
+import argparse
+import time
+import numpy as np
+
+from utils.ann_index import ExactIndex, build_index
+from utils.embedding_store import CatalogEmbeddingStore
+
+
+def make_synthetic_catalog(size, dim, n_clusters, seed):
+    """Normalised vectors drawn around random centres, roughly like CLIP product embeddings"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size)
+    embeddings = centres[labels] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+
+def measure(index, queries, k, **search_params):
+    """Run every query, returning (results, mean latency in ms)"""
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        rows, _ = index.search(query, k=k, **search_params)
+        results.append(rows)
+    elapsed = time.perf_counter() - start
+    return results, elapsed / len(queries) * 1000
+
+
+def recall_at_k(approximate, exact):
+    hits = sum(len(np.intersect1d(a, e)) for a, e in zip(approximate, exact))
+    return hits / sum(len(e) for e in exact)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--catalog', action='store_true', help="use the stored catalog embedding matrix")
+    parser.add_argument('--model-name', default="laion/CLIP-ViT-B-32-laion2B-s34B-b79K")
+    parser.add_argument('--size', type=int, default=100000, help="synthetic catalog size")
+    parser.add_argument('--dim', type=int, default=512, help="synthetic embedding dimension")
+    parser.add_argument('--clusters', type=int, default=200, help="synthetic catalog clusters")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--kind', default='ivf_flat', choices=['ivf_flat', 'hnsw'])
+    parser.add_argument('--n-lists', type=int, default=None, help="IVF cells, defaults to sqrt(N)")
+    parser.add_argument('--n-probe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--ef-search', type=int, nargs='+', default=[16, 32, 64, 128])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.catalog:
+        embeddings, _ = CatalogEmbeddingStore(args.model_name).open()
+    else:
+        embeddings = make_synthetic_catalog(args.size, args.dim, args.clusters, args.seed)
+
+    rng = np.random.default_rng(args.seed + 1)
+    query_rows = rng.choice(len(embeddings), size=min(args.queries, len(embeddings)), replace=False)
+    # Perturb catalog rows so queries are near, but not equal to, indexed vectors
+    queries = np.asarray(embeddings[query_rows], dtype=np.float32)
+    queries += 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    print(f"Catalog: {len(embeddings)} x {embeddings.shape[1]}, {len(queries)} queries, k={args.k}")
+
+    exact_results, exact_ms = measure(ExactIndex().build(embeddings), queries, args.k)
+    print(f"{'exact':<24} recall@{args.k}=1.000  {exact_ms:8.3f} ms/query")
+
+    start = time.perf_counter()
+    if args.kind == 'ivf_flat':
+        index = build_index(embeddings, kind='ivf_flat', n_lists=args.n_lists)
+        settings = [('n_probe', value) for value in args.n_probe]
+    else:
+        index = build_index(embeddings, kind='hnsw')
+        settings = [('ef_search', value) for value in args.ef_search]
+    print(f"Built {args.kind} index in {time.perf_counter() - start:.1f} s")
+
+    for name, value in settings:
+        results, latency_ms = measure(index, queries, args.k, **{name: value})
+        recall = recall_at_k(results, exact_results)
+        label = f"{args.kind} {name}={value}"
+        print(f"{label:<24} recall@{args.k}={recall:.3f}  {latency_ms:8.3f} ms/query  "
+              f"({exact_ms / latency_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark fast dominant-colour extraction against full-pixel KMeans.
+
+Times ColorAnalyzer.extract_dominant_colors with method='kmeans' (every
+pixel) and method='fast' (subsampled colour histogram) on synthetic photos
+of several sizes, or on any --images glob. It also checks that the two
+agree. Palettes are paired by minimum total CIE76 distance. A fast palette
+passes when the mean colour distance stays within --max-delta-e and the
+percentage gap within --max-weight-gap. Single-init KMeans can itself land
+in a poor local minimum, so a palette that differs still passes if it fits
+the pixels no worse than the reference (mean squared distance to the
+nearest palette colour, within --max-distortion-ratio).
+
+Usage:
+    python -m benchmarks.color_benchmark
+    python -m benchmarks.color_benchmark --sizes 640x480 4000x3000 --n-colors 5
+    python -m benchmarks.color_benchmark --images "images/**/*.jpg"
+"""
+import argparse
+import glob
+import os
+import time
+import numpy as np
+from PIL import Image
+from scipy.optimize import linear_sum_assignment
+
+from utils.color_analysis import ColorAnalyzer, rgb_to_lab_array
+
+
+def synthetic_photo(width, height, seed):
+    """A few soft-edged colour regions with sensor-like noise"""
+    rng = np.random.default_rng(seed)
+    base_colors = rng.integers(0, 256, (6, 3))
+    yy, xx = np.mgrid[0:height, 0:width]
+    centres = rng.uniform(0, 1, (len(base_colors), 2)) * [height, width]
+    distances = np.stack([(yy - cy) ** 2 + (xx - cx) ** 2 for cy, cx in centres])
+    image = base_colors[np.argmin(distances, axis=0)].astype(np.float32)
+    image += rng.normal(0, 12, image.shape)
+    return Image.fromarray(np.clip(image, 0, 255).astype(np.uint8))
+
+
+def load_images(pattern):
+    """Open every readable image matching the glob pattern"""
+    images = []
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        if os.path.getsize(path) == 0:
+            continue
+        try:
+            images.append((path, Image.open(path).convert('RGB')))
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+    return images
+
+
+def timed(fn, repeats):
+    """Run fn repeats times; return (last result, mean seconds)"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeats
+
+
+def palette_agreement(reference, candidate):
+    """Pair two palettes by minimum total Lab distance; return (mean deltaE, max weight gap)"""
+    ref_colors, ref_weights = reference
+    cand_colors, cand_weights = candidate
+    ref_lab = rgb_to_lab_array(np.asarray(ref_colors))
+    cand_lab = rgb_to_lab_array(np.asarray(cand_colors))
+    cost = np.linalg.norm(ref_lab[:, None, :] - cand_lab[None, :, :], axis=-1)
+    rows, cols = linear_sum_assignment(cost)
+
+    # Colours without a partner (fewer distinct bins than clusters) count as a full gap
+    matched_weights = np.zeros(len(ref_weights))
+    matched_weights[rows] = cand_weights[cols]
+    return float(cost[rows, cols].mean()), float(np.abs(ref_weights - matched_weights).max())
+
+
+def distortion(pixels, colors, max_samples=200000):
+    """Mean squared RGB distance from (a strided sample of) pixels to their nearest palette colour"""
+    step = -(-len(pixels) // max_samples)
+    sample = pixels[::step].astype(np.float64)
+    colors = np.asarray(colors, dtype=np.float64)
+    return float(((sample[:, None, :] - colors[None, :, :]) ** 2).sum(axis=-1).min(axis=1).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default=None, help="glob of images to use instead of synthetic photos")
+    parser.add_argument('--sizes', nargs='+', default=['640x480', '1920x1080', '4000x3000'],
+                        help="synthetic image sizes as WIDTHxHEIGHT")
+    parser.add_argument('--n-colors', type=int, default=5)
+    parser.add_argument('--repeats', type=int, default=3, help="timed passes of the fast method")
+    parser.add_argument('--max-delta-e', type=float, default=10.0,
+                        help="maximum mean CIE76 distance between paired colours")
+    parser.add_argument('--max-weight-gap', type=float, default=0.05,
+                        help="maximum absolute percentage difference of a paired colour")
+    parser.add_argument('--max-distortion-ratio', type=float, default=1.02,
+                        help="fast/kmeans distortion ratio accepted when the palettes differ")
+    args = parser.parse_args()
+
+    if args.images:
+        images = load_images(args.images)
+        if not images:
+            print(f"No readable images match '{args.images}'.")
+            return
+    else:
+        images = []
+        for seed, size in enumerate(args.sizes):
+            width, height = (int(v) for v in size.lower().split('x'))
+            images.append((f"synthetic {width}x{height}", synthetic_photo(width, height, seed)))
+
+    analyzer = ColorAnalyzer()
+    failures = 0
+    print(f"{'image':<28} {'pixels':>10} {'kmeans ms':>10} {'fast ms':>9} {'speedup':>8} "
+          f"{'dE':>6} {'w gap':>6} {'dist':>6}")
+
+    for name, image in images:
+        pixels = analyzer._image_pixels(image)
+        reference, kmeans_s = timed(lambda: analyzer._cluster_pixels(pixels, args.n_colors, 'kmeans'), 1)
+        candidate, fast_s = timed(lambda: analyzer._cluster_pixels(pixels, args.n_colors, 'fast'), args.repeats)
+        delta_e, weight_gap = palette_agreement(reference, candidate)
+
+        ratio = distortion(pixels, candidate[0]) / max(distortion(pixels, reference[0]), 1e-9)
+
+        ok = (delta_e <= args.max_delta_e and weight_gap <= args.max_weight_gap) \
+            or ratio <= args.max_distortion_ratio
+        failures += not ok
+        print(f"{name[-28:]:<28} {len(pixels):>10} {kmeans_s * 1000:>10.1f} {fast_s * 1000:>9.1f} "
+              f"{kmeans_s / fast_s:>7.1f}x {delta_e:>6.2f} {weight_gap:>6.3f} {ratio:>6.3f}"
+              f"{'' if ok else '  FAIL'}")
+
+    if failures:
+        raise SystemExit(f"{failures} image(s) outside the agreement tolerance")
+    print("Fast extraction agrees with full KMeans within tolerance.")
+
+
+if __name__ == "__main__":
+    main()
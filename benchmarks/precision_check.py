@@ -0,0 +1,81 @@
+"""
+Check how closely reduced-precision CLIP inference agrees with fp32.
+
+Embeds the bundled images (or any --images glob) with every selected
+precision and reports, per mode, the cosine agreement of each embedding
+with its fp32 counterpart and the mean time per image. Use it to choose
+CLIP_PRECISION and the thread settings for a deployment.
+
+Usage:
+    python -m benchmarks.precision_check
+    python -m benchmarks.precision_check --precisions fp32 int8 --num-threads 4 --batch-size 16
+"""
+import argparse
+import glob
+import os
+import time
+import numpy as np
+from PIL import Image
+
+from utils.clip_analyzer import CLIPAnalyzer, INFERENCE_PRECISIONS
+
+
+def load_images(pattern):
+    """Open every readable image matching the glob pattern"""
+    images = []
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        if os.path.getsize(path) == 0:
+            continue
+        try:
+            images.append(Image.open(path).convert('RGB'))
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default="images/**/*.jpg", help="glob of images to embed")
+    parser.add_argument('--precisions', nargs='+', default=list(INFERENCE_PRECISIONS),
+                        choices=INFERENCE_PRECISIONS)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--num-threads', type=int, default=None)
+    parser.add_argument('--num-interop-threads', type=int, default=None)
+    parser.add_argument('--repeats', type=int, default=3, help="timed passes per precision")
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        print(f"No readable images match '{args.images}'. Add images or pass --images.")
+        return
+
+    print(f"{len(images)} images, batch size {args.batch_size}")
+    reference = None
+    precisions = ['fp32'] + [p for p in args.precisions if p != 'fp32']
+
+    for precision in precisions:
+        analyzer = CLIPAnalyzer(precision=precision, num_threads=args.num_threads,
+                                num_interop_threads=args.num_interop_threads)
+        if not analyzer.initialize():
+            print(f"{precision}: failed to load model")
+            continue
+        if analyzer.precision != precision:
+            print(f"{precision}: not supported here, skipped")
+            continue
+
+        # Warm-up pass, then time the repeats
+        embeddings = analyzer.get_image_embeddings(images, batch_size=args.batch_size)
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            analyzer.get_image_embeddings(images, batch_size=args.batch_size)
+        ms_per_image = (time.perf_counter() - start) / (args.repeats * len(images)) * 1000
+
+        if reference is None:
+            reference = embeddings
+        agreement = np.sum(embeddings * reference, axis=1)
+        print(f"{precision:<5} {ms_per_image:8.2f} ms/image  "
+              f"cosine vs fp32: mean {agreement.mean():.4f}  min {agreement.min():.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,15 @@ import numpy as np
 import pandas as pd
 
 from utils.image_loader import ImageLoader
+from utils.image_processing import open_image, CLIP_DECODE_SIZE
 from utils.clip_analyzer import CLIPAnalyzer
+from utils.embedding_cache import EmbeddingCache
+from utils.embedding_store import CatalogEmbeddingStore
+from utils.retrieval import top_k_by_category_slice
+from utils.ann_index import build_index, load_index, search_by_category
+
+# Catalogs at least this large are searched through an approximate index
+ANN_MIN_CATALOG_SIZE = 100000
 
 def get_image(path):
     """Safely open an image, creating a dummy if it fails."""
@@ -13,31 +21,84 @@ def get_image(path):
         # Return a dummy image if the file doesn't exist or is empty
         return Image.new('RGB', (224, 224), color = 'gray')
     try:
-        image = Image.open(path)
+        # CLIP only needs 224px, so large JPEGs decode at a reduced DCT scale
+        image = open_image(path, CLIP_DECODE_SIZE)
         return image
     except Exception as e:
         print(f"Warning: Could not open image {path}. Using a dummy image. Error: {e}")
         return Image.new('RGB', (224, 224), color = 'gray')
 
+def embed_image_paths(clip_analyzer, paths, batch_size=32):
+    """Embed images from disk in mini-batches, returning an (N, D) float32 matrix."""
+    batches = []
+    for start in range(0, len(paths), batch_size):
+        # Only keep one batch of decoded images in memory at a time
+        images = [get_image(path) for path in paths[start:start + batch_size]]
+        batches.append(clip_analyzer.get_image_embeddings(images, batch_size=batch_size))
+    return np.concatenate(batches, axis=0)
+
+def get_cached_embeddings(clip_analyzer, embedding_cache, paths):
+    """
+    Return an (N, D) embedding matrix for image paths, running CLIP only for
+    images whose content is not already in the embedding cache.
+    Returns None if the model is needed but cannot be loaded.
+    """
+    found, missing = embedding_cache.lookup(paths)
+    print(f"Embedding cache: {len(found)} hits, {len(missing)} misses")
+
+    if missing:
+        # The model is only loaded when some image is not cached yet
+        if not clip_analyzer.is_ready():
+            clip_analyzer.start_background_initialize()
+            print("Waiting for the CLIP model to finish loading...")
+        if not clip_analyzer.wait_ready():
+            return None
+        # Deduplicate so repeated paths are only embedded once
+        unique_missing = list(dict.fromkeys(missing))
+        new_embeddings = embed_image_paths(clip_analyzer, unique_missing)
+        computed = dict(zip(unique_missing, new_embeddings))
+        embedding_cache.update(computed)
+        found.update(computed)
+    else:
+        # Persist any newly hashed files even when nothing needed the model
+        embedding_cache.save()
+
+    return np.stack([found[path] for path in paths]).astype(np.float32, copy=False)
+
+def get_product_index(catalog_store, product_embeddings, fingerprint, kind='ivf_flat'):
+    """Load the ANN index for the current catalog, rebuilding it when the catalog changed."""
+    index_dir = os.path.join(catalog_store.store_dir, f"index_{kind}")
+    fingerprint_path = os.path.join(index_dir, "fingerprint")
+    # The index stores row numbers, so it is also stale if the category layout of the rows changed
+    layout = sorted((category, part.start, part.stop) for category, part in catalog_store.category_slices().items())
+    fingerprint = f"{fingerprint}:{json.dumps(layout)}"
+
+    if os.path.exists(fingerprint_path):
+        with open(fingerprint_path) as f:
+            if f.read() == fingerprint:
+                return load_index(index_dir, product_embeddings)
+
+    print(f"Building {kind} index over {len(product_embeddings)} products...")
+    index = build_index(product_embeddings, kind=kind)
+    index.save(index_dir)
+    with open(fingerprint_path, 'w') as f:
+        f.write(fingerprint)
+    return index
+
 def run_recommendation(user_look_path: str):
     """
     Analyzes a user's look, finds the best style reference, and suggests products.
     """
     print("Starting recommendation process...")
 
-    # 1. Initialize components
+    # 1. Initialize components, the CLIP model loads only if an embedding is missing
     image_loader = ImageLoader()
     clip_analyzer = CLIPAnalyzer()
-
-    print("Initializing CLIP Analyzer (this may take a while)...")
-    if not clip_analyzer.initialize():
-        print("Failed to initialize CLIP Analyzer. Aborting.")
-        return
+    embedding_cache = EmbeddingCache(clip_analyzer.cache_name)
+    catalog_store = CatalogEmbeddingStore(clip_analyzer.cache_name)
 
     # 2. Load images and data
     print("Loading images...")
-    user_look_image = get_image(user_look_path)
-
     style_references = image_loader.load_style_references()
     if not style_references:
         print("No style references found in 'images/style_references/'. Aborting.")
@@ -48,22 +109,41 @@ def run_recommendation(user_look_path: str):
         print("No products found in 'images/products/'. Aborting.")
         return
 
-    # 3. Calculate embeddings
+    # 3. Calculate embeddings (only new or changed images go through the model)
     print("Calculating embeddings for all images...")
-    user_look_embedding = clip_analyzer.get_image_embedding(user_look_image)
+    ref_paths = [ref['path'] for ref in style_references]
+    query_paths = [user_look_path] + ref_paths
+    product_paths = products_df['image_url'].tolist()
+    fingerprint = catalog_store.catalog_fingerprint(
+        product_paths, [embedding_cache.content_hash(path) for path in product_paths]
+    )
+
+    if catalog_store.is_current(fingerprint):
+        # The shared catalog matrix is up to date, only the queries need embeddings
+        query_embeddings = get_cached_embeddings(clip_analyzer, embedding_cache, query_paths)
+    else:
+        all_embeddings = get_cached_embeddings(clip_analyzer, embedding_cache, query_paths + product_paths)
+        if all_embeddings is not None:
+            print("Writing catalog embedding matrix...")
+            catalog_store.build(products_df, all_embeddings[len(query_paths):], fingerprint)
+            query_embeddings = all_embeddings[:len(query_paths)]
+        else:
+            query_embeddings = None
+
+    if query_embeddings is None:
+        print("Failed to initialize CLIP Analyzer. Aborting.")
+        return
 
-    # Pre-calculate embeddings for style references
-    for ref in style_references:
-        ref_image = get_image(ref['path'])
-        ref['embedding'] = clip_analyzer.get_image_embedding(ref_image)
+    user_look_embedding = query_embeddings[0]
+
+    # Embeddings for style references
+    for ref, embedding in zip(style_references, query_embeddings[1:]):
+        ref['embedding'] = embedding
 
-    # Pre-calculate embeddings for products
-    product_embeddings = []
-    for _, row in products_df.iterrows():
-        product_image = get_image(row['image_url'])
-        embedding = clip_analyzer.get_image_embedding(product_image)
-        product_embeddings.append(embedding)
-    products_df['embedding'] = product_embeddings
+    # Product embeddings are memory-mapped, row i belongs to product_metadata row i,
+    # and each category is one contiguous block of rows
+    product_embeddings, product_metadata = catalog_store.open()
+    category_slices = catalog_store.category_slices()
 
     # 4. Find the best style reference
     print("Finding the best matching style reference...")
@@ -90,26 +170,29 @@ def run_recommendation(user_look_path: str):
     suggested_products = {}
     categories = ['shirt', 'pants', 'jacket', 'shoes', 'accessory']
 
+    if len(product_embeddings) >= ANN_MIN_CATALOG_SIZE:
+        # Large catalogs: probe an approximate index instead of scoring every product
+        product_index = get_product_index(catalog_store, product_embeddings, fingerprint)
+        best_by_category = search_by_category(
+            product_index, style_ref_embedding, category_slices,
+            k=1, category_names=categories, embeddings=product_embeddings
+        )
+    else:
+        # Score each category's block of rows, then pick its best with argpartition
+        best_by_category = top_k_by_category_slice(
+            style_ref_embedding, product_embeddings, category_slices,
+            k=1, category_names=categories
+        )
+
     for category in categories:
-        category_df = products_df[products_df['category'] == category]
-        if category_df.empty:
+        if category not in best_by_category:
             print(f"No products found for category: {category}")
             continue
 
-        best_product = None
-        highest_product_similarity = -1.0
-
-        for _, row in category_df.iterrows():
-            product_embedding = row['embedding']
-            similarity = clip_analyzer.calculate_similarity(style_ref_embedding, product_embedding)
-
-            if similarity > highest_product_similarity:
-                highest_product_similarity = similarity
-                best_product = row
-
-        if best_product is not None:
-            suggested_products[category] = best_product['image_url']
-            print(f"  - Best {category}: {best_product['name']} (Similarity: {highest_product_similarity:.4f})")
+        rows, similarities = best_by_category[category]
+        best_product = product_metadata.iloc[rows[0]]
+        suggested_products[category] = best_product['image_url']
+        print(f"  - Best {category}: {best_product['name']} (Similarity: {similarities[0]:.4f})")
 
     # 6. Format and print the final JSON output
     result = {
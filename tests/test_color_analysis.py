@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+
+from utils.color_analysis import ColorAnalyzer
+
+
+def test_get_color_names_matches_scalar_scan():
+    analyzer = ColorAnalyzer()
+    rng = np.random.default_rng(0)
+    colors = rng.integers(0, 256, (3000, 3))
+
+    names = analyzer.get_color_names(colors)
+
+    assert [analyzer.get_color_name(list(color)) for color in colors] == list(names)
+
+
+def test_get_color_names_is_exact_on_every_bin_corner():
+    analyzer = ColorAnalyzer()
+    corners = np.array([0, 7, 8, 15, 120, 127, 128, 135, 248, 255])
+    colors = np.stack(np.meshgrid(corners, corners, corners, indexing='ij'), axis=-1).reshape(-1, 3)
+
+    names = analyzer.get_color_names(colors)
+
+    assert [analyzer.get_color_name(list(color)) for color in colors] == list(names)
+
+
+def _scalar_harmony(colors):
+    """analyze_color_harmony as one cvtColor call per colour and a loop over the pairs"""
+    if len(colors) < 2:
+        return "monochromatic"
+    hues = [int(cv2.cvtColor(np.uint8([[color]]), cv2.COLOR_RGB2HSV)[0][0][0]) for color in colors]
+    differences = []
+    for i in range(len(hues)):
+        for j in range(i + 1, len(hues)):
+            diff = abs(hues[i] - hues[j])
+            differences.append(min(diff, 360 - diff))
+    average = np.mean(differences)
+    if average < 30:
+        return "analogous"
+    elif 60 <= average <= 120:
+        return "triadic"
+    elif 150 <= average <= 210:
+        return "complementary"
+    return "complex"
+
+
+def _scalar_temperature(color):
+    r, g, b = (int(c) for c in color)
+    warm_score = (r + (g * 0.5)) - b
+    if warm_score > 50:
+        return "warm"
+    elif warm_score < -50:
+        return "cool"
+    return "neutral"
+
+
+def test_analyze_color_harmony_batch_matches_scalar_loop():
+    analyzer = ColorAnalyzer()
+    rng = np.random.default_rng(1)
+
+    for n_colors in (1, 2, 3, 5):
+        outfits = rng.integers(0, 256, (200, n_colors, 3))
+
+        harmonies = analyzer.analyze_color_harmony_batch(outfits)
+
+        assert list(harmonies) == [_scalar_harmony(outfit.tolist()) for outfit in outfits]
+
+
+def test_hue_harmony_table_matches_harmony_of_colour_pairs():
+    analyzer = ColorAnalyzer()
+    rng = np.random.default_rng(2)
+    first, second = rng.integers(0, 256, (2, 500, 3))
+
+    table = analyzer.hue_harmony_table()
+    harmonies = table[analyzer.get_hues(first), analyzer.get_hues(second)]
+
+    assert list(harmonies) == [_scalar_harmony([a.tolist(), b.tolist()]) for a, b in zip(first, second)]
+
+
+def test_get_color_temperatures_matches_scalar_rule():
+    analyzer = ColorAnalyzer()
+    colors = np.random.default_rng(3).integers(0, 256, (2000, 3))
+
+    temperatures = analyzer.get_color_temperatures(colors)
+
+    assert list(temperatures) == [_scalar_temperature(color) for color in colors]
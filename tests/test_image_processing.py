@@ -0,0 +1,48 @@
+import numpy as np
+from PIL import Image
+
+from utils.image_processing import ImageProcessor
+
+STYLE_KEYS = ['brightness', 'contrast', 'saturation', 'edge_density', 'texture_complexity', 'color_variance']
+
+
+def _random_images(count, seed=0):
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        height, width = rng.integers(100, 400, 2)
+        # Blocky noise so the edge and gradient features are not saturated
+        small = rng.integers(0, 256, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+        pixels = np.kron(small, np.ones((8, 8, 1), dtype=np.uint8))[:height, :width]
+        images.append(Image.fromarray(pixels))
+    return images
+
+
+def test_extract_style_features_batch_matches_per_image():
+    processor = ImageProcessor()
+    images = _random_images(7)
+
+    batch = processor.extract_style_features_batch(images, chunk_size=3)
+
+    for row, image in enumerate(images):
+        expected = processor.extract_style_features(image)
+        for key in STYLE_KEYS:
+            # The per-image colour variance is accumulated in float32
+            assert np.isclose(batch[key][row], expected[key], rtol=1e-6, atol=1e-9), key
+
+
+def test_extract_style_features_batch_accepts_a_stack():
+    processor = ImageProcessor()
+    images = _random_images(4, seed=1)
+
+    from_list = processor.extract_style_features_batch(images)
+    from_stack = processor.extract_style_features_batch(processor.stack_images(images))
+
+    for key in STYLE_KEYS:
+        assert np.array_equal(from_list[key], from_stack[key])
+
+
+def test_extract_style_features_batch_of_no_images():
+    features = ImageProcessor().extract_style_features_batch([])
+
+    assert all(len(features[key]) == 0 for key in STYLE_KEYS)
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from data.sample_clothing import get_sample_clothing_data
+from utils.outfit_matcher import OutfitMatcher
+
+
+def _baseline_alternatives(matcher, outfit, clothing_data, inspiration_colors, k):
+    """suggest_alternatives as one scoring pass and nlargest per category"""
+    alternatives = {}
+    for category, selected_item in outfit.items():
+        category_items = clothing_data[clothing_data['category'] == category]
+        scored_items = matcher._score_all_items(inspiration_colors, {}, category_items)
+        best = scored_items[scored_items['name'] != selected_item['name']].nlargest(k, 'total_score')
+        alternatives[category] = [(item['name'], item['total_score']) for _, item in best.iterrows()]
+    return alternatives
+
+
+def test_suggest_alternatives_matches_per_category_scoring():
+    matcher = OutfitMatcher()
+    rng = np.random.default_rng(0)
+    clothing_data = pd.concat([get_sample_clothing_data()] * 3, ignore_index=True)
+    clothing_data['palette'] = [rng.integers(0, 256, (rng.integers(1, 4), 3)).tolist()
+                                for _ in range(len(clothing_data))]
+
+    for _ in range(5):
+        inspiration_colors = rng.integers(0, 256, (4, 3)).tolist()
+        outfit = matcher.find_best_matches(inspiration_colors, {}, clothing_data, threshold=0.0)
+
+        for k in (1, 3, 5):
+            alternatives = matcher.suggest_alternatives(outfit, clothing_data, inspiration_colors, k=k)
+
+            expected = _baseline_alternatives(matcher, outfit, clothing_data, inspiration_colors, k)
+            assert {category: [(item['name'], item['confidence']) for item in items]
+                    for category, items in alternatives.items()} == expected
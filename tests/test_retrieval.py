@@ -0,0 +1,57 @@
+import numpy as np
+
+from utils.retrieval import partition_by_category, top_k_by_category_slice, top_k_indices
+
+
+def _catalog(n_rows=3000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(n_rows, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    # Repeated rows give tied scores
+    embeddings[1::7] = embeddings[::7][:len(embeddings[1::7])]
+    categories = rng.choice(['shirt', 'pants', 'shoes', 'jacket', 'accessory'], n_rows, p=[.4, .3, .2, .09, .01])
+    return embeddings, categories
+
+
+def test_top_k_indices_matches_stable_sort():
+    rng = np.random.default_rng(1)
+    scores = rng.integers(0, 50, 1000).astype(np.float32)
+
+    for k in (0, 1, 5, 100, 1000, 2000):
+        expected = np.argsort(-scores, kind='stable')[:k]
+        assert np.array_equal(top_k_indices(scores, k), expected)
+
+
+def test_top_k_by_category_slice_matches_per_row_loop():
+    embeddings, categories = _catalog()
+    order, category_slices = partition_by_category(categories)
+    partitioned = embeddings[order]
+    query = embeddings[0]
+
+    best = top_k_by_category_slice(query, partitioned, category_slices, k=1)
+
+    # The per-row scan run_recommendation used, first-wins on ties
+    for category in set(categories):
+        best_row, highest = None, -1.0
+        for row in np.flatnonzero(categories == category):
+            similarity = np.clip(np.dot(query, embeddings[row]), 0.0, 1.0)
+            if similarity > highest:
+                best_row, highest = row, similarity
+        rows, scores = best[category]
+        assert order[rows[0]] == best_row
+        assert np.isclose(scores[0], highest, atol=1e-6)
+
+
+def test_top_k_by_category_slice_returns_k_best_first():
+    embeddings, categories = _catalog(seed=2)
+    order, category_slices = partition_by_category(categories)
+    partitioned = embeddings[order]
+    query = embeddings[3]
+    scores = np.clip(partitioned @ query, 0.0, 1.0)
+
+    best = top_k_by_category_slice(query, partitioned, category_slices, k=10, category_names=['shirt', 'hat'])
+
+    assert list(best) == ['shirt']
+    part = category_slices['shirt']
+    expected = part.start + np.argsort(-scores[part], kind='stable')[:10]
+    assert np.array_equal(best['shirt'][0], expected)
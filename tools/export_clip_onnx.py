@@ -0,0 +1,170 @@
+"""
+Export the CLIP image and text towers used by CLIPAnalyzer to ONNX.
+
+Writes image_tower.onnx, text_tower.onnx, tokenizer.json, the image
+preprocessing constants (preprocessing.json) and a manifest to
+models/onnx/<model>/. CLIPAnalyzer(backend='onnx') (or CLIP_BACKEND=onnx)
+then runs them through onnxruntime and the tokenizers package without
+importing torch or transformers. After exporting, the script compares the
+ONNX path, preprocessing included, with PyTorch on a few inputs and fails
+if they drift beyond --tolerance.
+
+Usage:
+    python -m tools.export_clip_onnx
+    python -m tools.export_clip_onnx --model-name openai/clip-vit-base-patch32 --opset 17
+"""
+import argparse
+import json
+import os
+import numpy as np
+import torch
+from PIL import Image
+from transformers import AutoModel, AutoProcessor
+
+from utils.clip_analyzer import ONNX_MODELS_DIR
+from utils.embedding_cache import model_slug
+from utils.onnx_preprocessing import ClipOnnxProcessor, PREPROCESSING_FILE, TOKENIZER_FILE
+
+
+class ImageTower(torch.nn.Module):
+    """pixel_values -> projected image features"""
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class TextTower(torch.nn.Module):
+    """(input_ids, attention_mask) -> projected text features"""
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+def normalize(features):
+    return features / np.linalg.norm(features, axis=-1, keepdims=True)
+
+
+def save_preprocessing(model, processor, output_dir):
+    """Write the tokenizer and image preprocessing constants ClipOnnxProcessor runs from"""
+    image_processor = processor.image_processor
+    tokenizer = processor.tokenizer
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, TOKENIZER_FILE))
+
+    with open(os.path.join(output_dir, PREPROCESSING_FILE), 'w') as f:
+        json.dump({
+            'shortest_edge': image_processor.size['shortest_edge'],
+            'crop_size': [image_processor.crop_size['height'], image_processor.crop_size['width']],
+            'resample': Image.Resampling(int(image_processor.resample)).name.lower(),
+            'rescale_factor': image_processor.rescale_factor,
+            'image_mean': list(image_processor.image_mean),
+            'image_std': list(image_processor.image_std),
+            'max_length': min(tokenizer.model_max_length, model.config.text_config.max_position_embeddings),
+            'pad_token_id': tokenizer.pad_token_id,
+            'pad_token': tokenizer.pad_token
+        }, f, indent=2)
+
+
+def verify(model, processor, output_dir, tolerance):
+    """
+    Compare the ONNX path (ClipOnnxProcessor + ONNX Runtime) against transformers
+    preprocessing + PyTorch on sample inputs; return the worst cosine gap.
+    """
+    import onnxruntime as ort
+
+    rng = np.random.default_rng(0)
+    images = [Image.fromarray(rng.integers(0, 256, (256, 192, 3), dtype=np.uint8)) for _ in range(3)]
+    texts = ["a photo of a formal outfit", "blue denim jacket", "white sneakers"]
+
+    image_inputs = processor(images=images, return_tensors="pt")
+    text_inputs = processor(text=texts, return_tensors="pt", padding=True, truncation=True)
+    with torch.no_grad():
+        torch_image = model.get_image_features(**image_inputs).numpy()
+        torch_text = model.get_text_features(**text_inputs).numpy()
+
+    image_session = ort.InferenceSession(os.path.join(output_dir, 'image_tower.onnx'),
+                                         providers=['CPUExecutionProvider'])
+    text_session = ort.InferenceSession(os.path.join(output_dir, 'text_tower.onnx'),
+                                        providers=['CPUExecutionProvider'])
+    onnx_processor = ClipOnnxProcessor(output_dir)
+    ort_image = image_session.run(None, onnx_processor(images=images))[0]
+    ort_text = text_session.run(None, onnx_processor(text=texts))[0]
+
+    gaps = []
+    for name, expected, actual in [('image', torch_image, ort_image), ('text', torch_text, ort_text)]:
+        cosine = np.sum(normalize(expected) * normalize(actual), axis=1)
+        gap = float(1 - cosine.min())
+        print(f"{name} tower: min cosine vs PyTorch {cosine.min():.6f}")
+        gaps.append(gap)
+
+    worst = max(gaps)
+    if worst > tolerance:
+        raise SystemExit(f"ONNX outputs differ from PyTorch by {worst:.2e} (tolerance {tolerance:.0e})")
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-name', default="laion/CLIP-ViT-B-32-laion2B-s34B-b79K")
+    parser.add_argument('--output-dir', default=None, help=f"defaults to {ONNX_MODELS_DIR}/<model>")
+    parser.add_argument('--opset', type=int, default=17)
+    parser.add_argument('--tolerance', type=float, default=1e-4, help="maximum allowed 1 - cosine vs PyTorch")
+    parser.add_argument('--skip-verify', action='store_true')
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or os.path.join(ONNX_MODELS_DIR, model_slug(args.model_name))
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"Loading {args.model_name}...")
+    processor = AutoProcessor.from_pretrained(args.model_name)
+    model = AutoModel.from_pretrained(args.model_name).eval()
+
+    image_size = processor.image_processor.crop_size['height']
+    dummy_pixels = torch.zeros(1, 3, image_size, image_size)
+    dummy_text = processor(text=["a photo"], return_tensors="pt", padding=True)
+
+    print("Exporting image tower...")
+    torch.onnx.export(
+        ImageTower(model), (dummy_pixels,), os.path.join(output_dir, 'image_tower.onnx'),
+        input_names=['pixel_values'], output_names=['image_embeds'],
+        dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+        opset_version=args.opset
+    )
+
+    print("Exporting text tower...")
+    torch.onnx.export(
+        TextTower(model), (dummy_text['input_ids'], dummy_text['attention_mask']),
+        os.path.join(output_dir, 'text_tower.onnx'),
+        input_names=['input_ids', 'attention_mask'], output_names=['text_embeds'],
+        dynamic_axes={
+            'input_ids': {0: 'batch', 1: 'sequence'},
+            'attention_mask': {0: 'batch', 1: 'sequence'},
+            'text_embeds': {0: 'batch'}
+        },
+        opset_version=args.opset
+    )
+
+    # Preprocessing runs from these files at inference time, without the hub or transformers
+    save_preprocessing(model, processor, output_dir)
+
+    if not args.skip_verify:
+        verify(model, processor, output_dir, args.tolerance)
+
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump({
+            'model_name': args.model_name,
+            'embedding_dim': model.config.projection_dim,
+            'logit_scale': float(model.logit_scale.exp()),
+            'opset': args.opset
+        }, f, indent=2)
+
+    print(f"ONNX export written to {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
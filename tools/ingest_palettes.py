@@ -0,0 +1,44 @@
+"""
+Extract dominant-colour palettes for every product image into the catalog.
+
+Runs fast palette extraction over images/products/ in a process pool and
+stores the palettes in cache/palettes/, keyed by image content hash. Only
+new or changed images are processed. The app and the matchers then read
+these palettes instead of guessing colours from filenames. Prints
+throughput in images per second, overall and per worker.
+
+Usage:
+    python -m tools.ingest_palettes
+    python -m tools.ingest_palettes --workers 4 --n-colors 5
+"""
+import argparse
+
+from utils.image_loader import ImageLoader
+from utils.palette_store import CatalogPaletteStore, ingest_palettes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--n-colors', type=int, default=5)
+    parser.add_argument('--chunksize', type=int, default=4, help="images handed to a worker at a time")
+    args = parser.parse_args()
+
+    products_df = ImageLoader().load_products_from_directory()
+    if products_df.empty:
+        print("No products found in 'images/products/'.")
+        return
+
+    palette_store = CatalogPaletteStore(n_colors=args.n_colors)
+    stats = ingest_palettes(products_df['image_url'].tolist(), palette_store,
+                            max_workers=args.workers, chunksize=args.chunksize)
+
+    if stats['images'] == 0:
+        print(f"All {len(products_df)} product palettes are up to date ({len(palette_store)} stored).")
+        return
+    print(f"Extracted {stats['images']} palettes in {stats['seconds']:.2f}s with {stats['workers']} workers: "
+          f"{stats['images_per_second']:.1f} images/s, {stats['images_per_second_per_core']:.1f} images/s per core")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import json
+import os
+import numpy as np
+from sklearn.cluster import KMeans
+
+from utils.retrieval import cosine_scores, top_k_indices
+
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    hnswlib = None
+    HNSWLIB_AVAILABLE = False
+
+
+class ExactIndex:
+    """Brute-force inner-product search, used as the recall baseline"""
+    kind = 'exact'
+
+    def __init__(self):
+        self.embeddings = None
+
+    def build(self, embeddings):
+        self.embeddings = embeddings
+        return self
+
+    def search(self, query, k=10, mask=None, row_range=None):
+        """
+        Return (row_indices, scores) of the k best rows, best first.
+        row_range=(start, stop) limits the search to those rows, mask to the rows it marks.
+        """
+        start, stop = row_range or (0, len(self.embeddings))
+        if mask is None:
+            scores = cosine_scores(query, self.embeddings[start:stop])
+            best = top_k_indices(scores, k)
+            return start + best, scores[best]
+
+        # Only score the eligible rows
+        rows = start + np.flatnonzero(np.asarray(mask, dtype=bool)[start:stop])
+        scores = cosine_scores(query, self.embeddings[rows])
+        best = top_k_indices(scores, k)
+        return rows[best], scores[best]
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        _write_manifest(index_dir, {'kind': self.kind, 'size': len(self.embeddings)})
+
+    @classmethod
+    def load(cls, index_dir, embeddings):
+        return cls().build(embeddings)
+
+    def __len__(self):
+        return 0 if self.embeddings is None else len(self.embeddings)
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file index over normalised embeddings, implemented in NumPy.
+
+    Rows are clustered with k-means into n_lists cells and stored contiguously
+    cell by cell. A query scores the centroids, probes the n_probe closest cells
+    and scores only their rows exactly. Raising n_probe trades latency for recall.
+    """
+    kind = 'ivf_flat'
+
+    def __init__(self, n_lists=None, n_probe=8, train_size=50000, random_state=42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_size = train_size
+        self.random_state = random_state
+
+        self.centroids = None
+        self.vectors = None
+        self.row_ids = None
+        self.offsets = None
+
+    def build(self, embeddings):
+        """Train the coarse quantiser and bucket every row into its cell"""
+        n_rows = len(embeddings)
+        if n_rows == 0:
+            raise ValueError("Cannot build an index over an empty catalog")
+        n_lists = self.n_lists or max(1, int(np.sqrt(n_rows)))
+        n_lists = min(n_lists, n_rows)
+
+        # Train k-means on a random sample, the catalog itself may not fit in memory
+        rng = np.random.default_rng(self.random_state)
+        sample_size = min(n_rows, max(self.train_size, n_lists))
+        sample_rows = np.sort(rng.choice(n_rows, size=sample_size, replace=False))
+        sample = np.asarray(embeddings[sample_rows], dtype=np.float32)
+
+        kmeans = KMeans(n_clusters=n_lists, random_state=self.random_state, n_init='auto')
+        kmeans.fit(sample)
+        centroids = kmeans.cluster_centers_.astype(np.float32)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.maximum(norms, 1e-12)
+
+        # Assign every row to its most similar centroid, a chunk at a time
+        assignments = np.empty(n_rows, dtype=np.int32)
+        chunk_size = 65536
+        for start in range(0, n_rows, chunk_size):
+            block = np.asarray(embeddings[start:start + chunk_size], dtype=np.float32)
+            assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+
+        self.row_ids = np.argsort(assignments, kind='stable').astype(np.int64)
+        counts = np.bincount(assignments, minlength=n_lists)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.vectors = np.asarray(embeddings[self.row_ids], dtype=np.float32)
+        self.n_lists = n_lists
+        return self
+
+    def search(self, query, k=10, mask=None, row_range=None, n_probe=None):
+        """Return (row_indices, scores) of the approximate k best rows, best first"""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+
+        positions = np.concatenate([
+            np.arange(self.offsets[cell], self.offsets[cell + 1]) for cell in probe
+        ])
+        candidate_ids = self.row_ids[positions]
+        if row_range is not None:
+            keep = (candidate_ids >= row_range[0]) & (candidate_ids < row_range[1])
+            positions, candidate_ids = positions[keep], candidate_ids[keep]
+        if mask is not None:
+            keep = np.asarray(mask, dtype=bool)[candidate_ids]
+            positions, candidate_ids = positions[keep], candidate_ids[keep]
+
+        scores = np.clip(self.vectors[positions] @ query, 0.0, 1.0)
+
+        # Sort by original row id so ties resolve the same way as exact search
+        order = np.argsort(candidate_ids, kind='stable')
+        candidate_ids, scores = candidate_ids[order], scores[order]
+        best = top_k_indices(scores, k)
+        return candidate_ids[best], scores[best]
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, 'centroids.npy'), self.centroids)
+        np.save(os.path.join(index_dir, 'vectors.npy'), self.vectors)
+        np.save(os.path.join(index_dir, 'row_ids.npy'), self.row_ids)
+        np.save(os.path.join(index_dir, 'offsets.npy'), self.offsets)
+        _write_manifest(index_dir, {
+            'kind': self.kind,
+            'size': len(self.row_ids),
+            'n_lists': self.n_lists,
+            'n_probe': self.n_probe
+        })
+
+    @classmethod
+    def load(cls, index_dir, embeddings=None):
+        manifest = _read_manifest(index_dir)
+        index = cls(n_lists=manifest['n_lists'], n_probe=manifest['n_probe'])
+        index.centroids = np.load(os.path.join(index_dir, 'centroids.npy'))
+        # The reordered vectors are memory-mapped so workers share them
+        index.vectors = np.load(os.path.join(index_dir, 'vectors.npy'), mmap_mode='r')
+        index.row_ids = np.load(os.path.join(index_dir, 'row_ids.npy'))
+        index.offsets = np.load(os.path.join(index_dir, 'offsets.npy'))
+        return index
+
+    def __len__(self):
+        return 0 if self.row_ids is None else len(self.row_ids)
+
+
+class HNSWIndex:
+    """Graph-based index backed by the optional hnswlib package"""
+    kind = 'hnsw'
+
+    def __init__(self, M=16, ef_construction=200, ef_search=64):
+        if not HNSWLIB_AVAILABLE:
+            raise ImportError("hnswlib is not installed. Install it or use the 'ivf_flat' index.")
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = None
+        self.size = 0
+
+    def build(self, embeddings):
+        n_rows, dim = embeddings.shape
+        self.index = hnswlib.Index(space='ip', dim=dim)
+        self.index.init_index(max_elements=n_rows, ef_construction=self.ef_construction, M=self.M)
+        self.index.add_items(np.asarray(embeddings, dtype=np.float32), np.arange(n_rows))
+        self.index.set_ef(self.ef_search)
+        self.size = n_rows
+        return self
+
+    def search(self, query, k=10, mask=None, row_range=None, ef_search=None):
+        """Return (row_indices, scores) of the approximate k best rows, best first"""
+        query = np.asarray(query, dtype=np.float32).reshape(1, -1)
+        ef = max(ef_search or self.ef_search, k)
+        self.index.set_ef(ef)
+
+        row_filter = None
+        if mask is not None or row_range is not None:
+            start, stop = row_range or (0, self.size)
+            if mask is None:
+                k = min(k, stop - start)
+                row_filter = lambda row: start <= row < stop
+            else:
+                mask = np.asarray(mask, dtype=bool)
+                k = min(k, int(mask[start:stop].sum()))
+                row_filter = lambda row: start <= row < stop and bool(mask[row])
+        k = min(k, self.size)
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        labels, distances = self.index.knn_query(query, k=k, filter=row_filter)
+        # hnswlib's inner-product distance is 1 - <q, x>
+        scores = np.clip(1.0 - distances[0], 0.0, 1.0).astype(np.float32)
+        return labels[0].astype(np.int64), scores
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        self.index.save_index(os.path.join(index_dir, 'hnsw.bin'))
+        _write_manifest(index_dir, {
+            'kind': self.kind,
+            'size': self.size,
+            'dim': self.index.dim,
+            'M': self.M,
+            'ef_construction': self.ef_construction,
+            'ef_search': self.ef_search
+        })
+
+    @classmethod
+    def load(cls, index_dir, embeddings=None):
+        manifest = _read_manifest(index_dir)
+        index = cls(M=manifest['M'], ef_construction=manifest['ef_construction'],
+                    ef_search=manifest['ef_search'])
+        index.index = hnswlib.Index(space='ip', dim=manifest['dim'])
+        index.index.load_index(os.path.join(index_dir, 'hnsw.bin'), max_elements=manifest['size'])
+        index.index.set_ef(index.ef_search)
+        index.size = manifest['size']
+        return index
+
+    def __len__(self):
+        return self.size
+
+
+INDEX_TYPES = {
+    ExactIndex.kind: ExactIndex,
+    IVFFlatIndex.kind: IVFFlatIndex,
+    HNSWIndex.kind: HNSWIndex
+}
+
+
+def build_index(embeddings, kind='ivf_flat', **params):
+    """Build an index of the given kind ('exact', 'ivf_flat' or 'hnsw') over an (N, D) matrix"""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index kind '{kind}'. Choose from {sorted(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](**params).build(embeddings)
+
+
+def load_index(index_dir, embeddings=None):
+    """Load an index saved with .save(); exact indexes need the embedding matrix"""
+    manifest = _read_manifest(index_dir)
+    return INDEX_TYPES[manifest['kind']].load(index_dir, embeddings)
+
+
+def search_by_category(index, query, categories, k=1, category_names=None, embeddings=None, **search_params):
+    """
+    Query an index once per category and return {category: (row_indices, scores)}.
+    categories is an array of per-row labels, or {category: slice} for a catalog
+    stored grouped by category (see retrieval.partition_by_category).
+    If the index returns fewer than k rows for a category and the embedding matrix
+    is given, that category is scored exactly instead; small categories are cheap.
+    """
+    if isinstance(categories, dict):
+        if category_names is None:
+            category_names = list(categories)
+    else:
+        categories = np.asarray(categories)
+        if category_names is None:
+            category_names = list(dict.fromkeys(categories.tolist()))
+
+    results = {}
+    for category in category_names:
+        if isinstance(categories, dict):
+            # A contiguous block of rows is searched by its bounds, no per-row mask
+            part = categories.get(category, slice(0, 0))
+            filters = {'row_range': (part.start, part.stop)}
+            n_rows = part.stop - part.start
+        else:
+            filters = {'mask': categories == category}
+            n_rows = int(filters['mask'].sum())
+        if n_rows <= 0:
+            continue
+
+        rows, scores = index.search(query, k=k, **filters, **search_params)
+        if len(rows) < min(k, n_rows) and embeddings is not None:
+            rows, scores = ExactIndex().build(embeddings).search(query, k=k, **filters)
+        if len(rows):
+            results[category] = (rows, scores)
+
+    return results
+
+
+def _write_manifest(index_dir, manifest):
+    with open(os.path.join(index_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+
+def _read_manifest(index_dir):
+    with open(os.path.join(index_dir, 'manifest.json')) as f:
+        return json.load(f)
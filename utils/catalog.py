@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+from utils.color_analysis import ColorAnalyzer, rgb_to_lab_array
+from utils.retrieval import partition_by_category
+
+CATEGORIES = ['shirt', 'pants', 'shoes', 'jacket', 'accessory']
+
+# RGB used for an item without an extracted palette, looked up by primary_color
+COLOR_MAP = {
+    'black': [0, 0, 0],
+    'white': [255, 255, 255],
+    'red': [255, 0, 0],
+    'blue': [0, 0, 255],
+    'green': [0, 255, 0],
+    'yellow': [255, 255, 0],
+    'brown': [165, 42, 42],
+    'gray': [128, 128, 128],
+    'navy': [0, 0, 128],
+    'beige': [245, 245, 220],
+    'pink': [255, 192, 203],
+    'purple': [128, 0, 128],
+    'orange': [255, 165, 0],
+    'maroon': [128, 0, 0],
+    'olive': [128, 128, 0],
+    'teal': [0, 128, 128]
+}
+DEFAULT_ITEM_COLOR = [128, 128, 128]
+
+# Colour names that go with everything
+NEUTRAL_COLOR_NAMES = ['black', 'white', 'gray', 'beige']
+
+
+def item_colors(item):
+    """RGB colours of a catalog item: its extracted palette, else its primary_color"""
+    palette = item.get('palette')
+    if isinstance(palette, list) and palette:
+        return palette
+    return [COLOR_MAP.get(item['primary_color'].lower(), DEFAULT_ITEM_COLOR)]
+
+
+class CompiledCatalog:
+    """
+    Column arrays for scoring a products table, built once per catalog.
+
+    products is stored grouped by category (keeping its index labels), so every
+    category is one contiguous slice, see category_slice. Row i of every array
+    belongs to row i of products. Item colours are padded to the longest palette:
+    colors and lab are (N, K, 3) and color_mask marks the real entries. Styles are
+    integer codes into the styles vocabulary.
+    """
+    def __init__(self, products: pd.DataFrame):
+        order, self.category_slices = partition_by_category(
+            products['category'].to_numpy() if 'category' in products else []
+        )
+        products = products.iloc[order]
+        self.products = products
+        color_analyzer = ColorAnalyzer()
+
+        colors_by_item = [item_colors(item) for item in products.to_dict('records')]
+        n_items = len(colors_by_item)
+        max_colors = max((len(colors) for colors in colors_by_item), default=1)
+
+        self.colors = np.zeros((n_items, max_colors, 3), dtype=np.int64)
+        self.color_mask = np.zeros((n_items, max_colors), dtype=bool)
+        for row, colors in enumerate(colors_by_item):
+            self.colors[row, :len(colors)] = colors
+            self.color_mask[row, :len(colors)] = True
+        self.color_count = self.color_mask.sum(axis=1)
+
+        flat_colors = self.colors.reshape(-1, 3)
+        self.lab = rgb_to_lab_array(flat_colors).reshape(n_items, max_colors, 3)
+        self.color_names = color_analyzer.get_color_names(flat_colors).reshape(n_items, max_colors)
+        self.color_temps = color_analyzer.get_color_temperatures(flat_colors).reshape(n_items, max_colors)
+        self.neutral = np.isin(self.color_names, NEUTRAL_COLOR_NAMES) & self.color_mask
+
+        self.style_code, self.styles = self._factorize(products, 'style', lambda style: style.lower())
+        self.solid = np.array(['solid' in description.lower() for description in products.get('description', [])],
+                              dtype=bool)
+
+    @staticmethod
+    def _factorize(products, column, normalize):
+        """Integer codes for a column and the vocabulary they index"""
+        values = [normalize(value) for value in products[column]] if column in products else []
+        codes, vocabulary = pd.factorize(pd.Series(values, dtype=object))
+        return codes, np.asarray(vocabulary, dtype=object)
+
+    def __len__(self):
+        return len(self.products)
+
+    def category_slice(self, category):
+        """Slice of the rows holding a category's items (empty if it has none)"""
+        return self.category_slices.get(category, slice(0, 0))
+
+    def style_lookup(self, table, default):
+        """Per-row value of a {style: value} table, default for styles not in it"""
+        values = np.array([table.get(style, default) for style in self.styles] + [default])
+        # pandas codes missing styles as -1, which picks the trailing default
+        return values[self.style_code]
+
+    def color_similarity(self, colors):
+        """
+        CIE76 similarity (see ColorAnalyzer.color_similarity_matrix) of every item
+        colour to each of the given colours, as an (N, K, M) array.
+        """
+        lab = rgb_to_lab_array(np.asarray(colors).reshape(-1, 3))
+        item_lab = self.lab[:, :, None, :]
+        delta_e = np.sqrt(
+            (item_lab[..., 0] - lab[:, 0]) ** 2 +
+            (item_lab[..., 1] - lab[:, 1]) ** 2 +
+            (item_lab[..., 2] - lab[:, 2]) ** 2
+        )
+        return np.maximum(0, 1 - delta_e / 100)
+
+    def best_color_match(self, colors):
+        """Best similarity between any item colour and any of the given colours, per item"""
+        if not len(self) or not len(colors):
+            return np.zeros(len(self))
+        similarity = self.color_similarity(colors).max(axis=2)
+        return np.where(self.color_mask, similarity, -np.inf).max(axis=1)
+
+    def mean_color_match(self, colors):
+        """Mean over each item's colours of its best similarity to the given colours"""
+        if not len(self) or not len(colors):
+            return np.zeros(len(self))
+        similarity = self.color_similarity(colors).max(axis=2)
+        return np.where(self.color_mask, similarity, 0.0).sum(axis=1) / self.color_count
+
+
+def compile_catalog(clothing_data):
+    """
+    Return clothing_data if it is already a CompiledCatalog, otherwise compile it.
+    A DataFrame is compiled on every call; callers that score the same catalog
+    repeatedly should compile it once and pass the CompiledCatalog.
+    """
+    if isinstance(clothing_data, CompiledCatalog):
+        return clothing_data
+    return CompiledCatalog(clothing_data)
@@ -1,37 +1,314 @@
-import torch
-from transformers import AutoProcessor, AutoModel
+import contextlib
+import hashlib
+import importlib.util
+import json
+import os
+import threading
 from PIL import Image
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+from utils.embedding_cache import EmbeddingCache, model_slug
+from utils.onnx_preprocessing import ClipOnnxProcessor
+from utils.prompt_bank import PromptBank
+from utils.image_processing import open_image, CLIP_DECODE_SIZE
+
+# Zero-shot prompts for the style of a look
+STYLE_PROMPTS = {
+    'formal': "a photo of a formal outfit",
+    'casual': "a photo of a casual outfit",
+    'business': "a photo of a business outfit",
+    'sporty': "a photo of a sporty outfit",
+    'elegant': "a photo of an elegant outfit"
+}
+
+# Zero-shot prompts for the colour character of a look
+COLOR_STYLE_PROMPTS = {
+    'monochrome': "an outfit in black, white and gray",
+    'bright': "an outfit with bright, vivid colors",
+    'pastel': "an outfit with soft pastel colors",
+    'warm': "an outfit in warm colors like red, orange and brown",
+    'cool': "an outfit in cool colors like blue, green and purple"
+}
+
+# Prompt sets scored together by the zero-shot prompt bank
+PROMPT_SETS = {
+    'style': STYLE_PROMPTS,
+    'color_style': COLOR_STYLE_PROMPTS
+}
+
+# Inference precisions: fp32 as trained, dynamic int8 quantisation of the
+# linear layers (CPU only) and bfloat16 autocast
+INFERENCE_PRECISIONS = ('fp32', 'int8', 'bf16')
+
+# Inference backends: PyTorch through transformers, or ONNX Runtime over towers
+# exported with tools/export_clip_onnx.py (no torch import at all)
+INFERENCE_BACKENDS = ('torch', 'onnx')
+ONNX_MODELS_DIR = "models/onnx"
+
+# CLIP image-text cosines sit in a much lower band than image-image ones: a photo
+# and a caption that describes it well score about 0.35, where two photos of the
+# same item score close to 1.0. Items matched through their text are divided by
+# that typical cosine so both kinds of match are compared against one threshold.
+TEXT_MATCH_COSINE = 0.35
+TEXT_MATCH_SCALE = 1 / TEXT_MATCH_COSINE
 
 class CLIPAnalyzer:
     """
     A class to analyze images using a real CLIP model.
     """
-    def __init__(self, model_name="laion/CLIP-ViT-B-32-laion2B-s34B-b79K"):
+    def __init__(self, model_name="laion/CLIP-ViT-B-32-laion2B-s34B-b79K", background_load=False,
+                 precision=None, num_threads=None, num_interop_threads=None, backend=None, onnx_dir=None):
         self.model_name = model_name
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        # Inference settings default to the CLIP_PRECISION, CLIP_BACKEND, CLIP_NUM_THREADS
+        # and CLIP_NUM_INTEROP_THREADS environment variables so each deployment can choose
+        self.precision = precision or os.environ.get('CLIP_PRECISION', 'fp32')
+        if self.precision not in INFERENCE_PRECISIONS:
+            raise ValueError(f"precision must be one of {INFERENCE_PRECISIONS}, got '{self.precision}'")
+        self.backend = backend or os.environ.get('CLIP_BACKEND', 'torch')
+        if self.backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"backend must be one of {INFERENCE_BACKENDS}, got '{self.backend}'")
+        self.num_threads = num_threads or _env_int('CLIP_NUM_THREADS')
+        self.num_interop_threads = num_interop_threads or _env_int('CLIP_NUM_INTEROP_THREADS')
+        self.onnx_dir = onnx_dir or os.path.join(ONNX_MODELS_DIR, model_slug(model_name))
+
+        if self.backend == 'onnx':
+            self._resolve_onnx_backend()
+
+        self.device = "cpu"
+        if self.backend == 'torch':
+            self._resolve_torch_device()
+
         self.model = None
         self.processor = None
+        self.image_session = None
+        self.text_session = None
+        self.embedding_dim = None
+        self.logit_scale = 100.0
         self.initialized = False
+        self.load_error = None
+
+        self.embedding_cache = None
+        self.prompt_bank = None
+        self._text_embeddings = {}
+        self._last_query = (None, None)
+        # The analyzer is shared between app sessions, so its in-memory caches are guarded
+        self._cache_lock = threading.Lock()
+
+        self._load_lock = threading.Lock()
+        self._load_thread = None
+        if background_load:
+            self.start_background_initialize()
+
+    def _resolve_onnx_backend(self):
+        """Fall back to transformers when onnxruntime, tokenizers or the exported files are missing"""
+        if importlib.util.find_spec('onnxruntime') is None or importlib.util.find_spec('tokenizers') is None:
+            print("Warning: onnxruntime or tokenizers is not installed, using the transformers backend.")
+            self.backend = 'torch'
+        elif not (os.path.exists(os.path.join(self.onnx_dir, 'manifest.json'))
+                  and ClipOnnxProcessor.available(self.onnx_dir)):
+            print(f"Warning: No complete ONNX export in {self.onnx_dir}, using the transformers backend. "
+                  f"Run 'python -m tools.export_clip_onnx' to create it.")
+            self.backend = 'torch'
+        elif self.precision != 'fp32':
+            print(f"Warning: The ONNX backend runs fp32 only, ignoring precision '{self.precision}'.")
+            self.precision = 'fp32'
+
+    def _resolve_torch_device(self):
+        """Pick the device for the transformers backend and check bf16 support on it"""
+        if importlib.util.find_spec('torch') is None:
+            return
+        import torch
+        # Dynamic quantisation only has CPU kernels
+        if torch.cuda.is_available() and self.precision != 'int8':
+            self.device = "cuda"
+        if self.precision == 'bf16' and not self._bf16_supported():
+            print(f"Warning: bf16 is not supported on {self.device}, using fp32 instead.")
+            self.precision = 'fp32'
 
     def initialize(self):
         """
-        Loads the CLIP model and processor from Hugging Face.
+        Loads the CLIP model and processor from Hugging Face, or the exported
+        ONNX towers when the onnx backend is selected.
+        Safe to call while a background load is running; it waits for that load.
         """
-        if self.initialized:
-            return True
+        with self._load_lock:
+            if self.initialized:
+                return True
+            try:
+                if self.backend == 'onnx':
+                    self._initialize_onnx_or_torch()
+                else:
+                    self._initialize_torch()
+                self.initialized = True
+                self.load_error = None
+                print("CLIP model loaded successfully.")
+                return True
+            except Exception as e:
+                self.load_error = e
+                print(f"Error loading CLIP model: {e}")
+                return False
+
+    def _initialize_torch(self):
+        import torch
+        from transformers import AutoProcessor, AutoModel
+
+        print(f"Loading CLIP model: {self.model_name} on device: {self.device} ({self.precision})")
+        self._configure_threads()
+        self.processor = AutoProcessor.from_pretrained(self.model_name)
+        model = AutoModel.from_pretrained(self.model_name).to(self.device).eval()
+        self.embedding_dim = model.config.projection_dim
+        self.logit_scale = float(model.logit_scale.exp())
+        if self.precision == 'int8':
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+
+    def _initialize_onnx_or_torch(self):
+        """Load the ONNX towers, falling back to the transformers backend if they fail to load"""
         try:
-            print(f"Loading CLIP model: {self.model_name} on device: {self.device}")
-            self.processor = AutoProcessor.from_pretrained(self.model_name)
-            self.model = AutoModel.from_pretrained(self.model_name).to(self.device)
-            self.initialized = True
-            print("CLIP model loaded successfully.")
-            return True
+            self._initialize_onnx()
         except Exception as e:
-            print(f"Error loading CLIP model: {e}")
+            print(f"Warning: Could not load the ONNX export in {self.onnx_dir} ({e}), "
+                  f"using the transformers backend.")
+            self.processor = self.image_session = self.text_session = None
+            self.backend = 'torch'
+            self._resolve_torch_device()
+            self._initialize_torch()
+
+    def _initialize_onnx(self):
+        import onnxruntime as ort
+
+        print(f"Loading ONNX CLIP towers from {self.onnx_dir} (onnxruntime {ort.__version__})")
+        with open(os.path.join(self.onnx_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('model_name') != self.model_name:
+            raise ValueError(f"ONNX export in {self.onnx_dir} is for {manifest.get('model_name')}")
+
+        options = ort.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        if self.num_interop_threads:
+            options.inter_op_num_threads = self.num_interop_threads
+        providers = ['CPUExecutionProvider']
+
+        # Preprocessing runs from files saved next to the towers, without transformers
+        self.processor = ClipOnnxProcessor(self.onnx_dir)
+        self.image_session = ort.InferenceSession(
+            os.path.join(self.onnx_dir, 'image_tower.onnx'), options, providers=providers
+        )
+        self.text_session = ort.InferenceSession(
+            os.path.join(self.onnx_dir, 'text_tower.onnx'), options, providers=providers
+        )
+        self.embedding_dim = manifest['embedding_dim']
+        self.logit_scale = manifest['logit_scale']
+
+    def _bf16_supported(self) -> bool:
+        """Check whether bfloat16 kernels are available on the selected device"""
+        import torch
+        try:
+            if self.device == "cuda":
+                return torch.cuda.is_bf16_supported()
+            return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+        except (AttributeError, RuntimeError):
             return False
 
+    def _configure_threads(self):
+        """Apply intra-op and inter-op thread settings; these are process-wide in PyTorch"""
+        import torch
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        if self.num_interop_threads:
+            try:
+                torch.set_num_interop_threads(self.num_interop_threads)
+            except RuntimeError as e:
+                # Can only be set once, before any inter-op parallel work has started
+                print(f"Warning: Could not set inter-op threads: {e}")
+
+    @property
+    def cache_name(self) -> str:
+        """Name embeddings are cached under; reduced-precision modes get their own namespace"""
+        if self.precision == 'fp32':
+            return self.model_name
+        return f"{self.model_name}@{self.precision}"
+
+    def _inference_context(self):
+        """Autocast context for the selected precision"""
+        if self.precision == 'bf16':
+            import torch
+            return torch.autocast(device_type=self.device, dtype=torch.bfloat16)
+        return contextlib.nullcontext()
+
+    def _encode_images(self, images: List[Image.Image]) -> np.ndarray:
+        """Run preprocessing and the image tower, returning L2-normalised float32 rows"""
+        if self.backend == 'onnx':
+            inputs = self.processor(images=images, return_tensors="np")
+            image_features = self.image_session.run(
+                None, {'pixel_values': inputs['pixel_values'].astype(np.float32)}
+            )[0]
+            return _l2_normalize(image_features)
+
+        import torch
+        inputs = self.processor(images=images, return_tensors="pt").to(self.device)
+        with torch.no_grad(), self._inference_context():
+            image_features = self.model.get_image_features(**inputs)
+
+        # Normalize features in fp32 whatever precision the tower ran in
+        image_features = image_features.float()
+        image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
+        return image_features.cpu().numpy()
+
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Run tokenisation and the text tower, returning L2-normalised float32 rows"""
+        if self.backend == 'onnx':
+            inputs = self.processor(text=texts, return_tensors="np", padding=True, truncation=True)
+            text_features = self.text_session.run(None, {
+                'input_ids': inputs['input_ids'].astype(np.int64),
+                'attention_mask': inputs['attention_mask'].astype(np.int64)
+            })[0]
+            return _l2_normalize(text_features)
+
+        import torch
+        inputs = self.processor(text=texts, return_tensors="pt", padding=True, truncation=True).to(self.device)
+        with torch.no_grad(), self._inference_context():
+            text_features = self.model.get_text_features(**inputs)
+
+        # Normalize features in fp32 whatever precision the tower ran in
+        text_features = text_features.float()
+        text_features = text_features / text_features.norm(p=2, dim=-1, keepdim=True)
+        return text_features.cpu().numpy()
+
+    def start_background_initialize(self):
+        """
+        Starts loading the model in a daemon thread and returns immediately.
+        Use is_ready() to poll and wait_ready() to block until the load finishes.
+        """
+        if self.initialized or self.is_loading():
+            return
+        self._load_thread = threading.Thread(target=self.initialize, name="clip-model-loader", daemon=True)
+        self._load_thread.start()
+
+    def is_loading(self) -> bool:
+        """True while a background load is in progress"""
+        return self._load_thread is not None and self._load_thread.is_alive()
+
+    def is_ready(self) -> bool:
+        """True once the model is loaded and embeddings can be computed"""
+        return self.initialized
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the model is loaded or timeout seconds have passed.
+        Loads synchronously if no background load was started.
+        Returns True if the model is ready.
+        """
+        if self.initialized:
+            return True
+        if self._load_thread is None:
+            return self.initialize()
+        self._load_thread.join(timeout)
+        return self.initialized
+
     def get_image_embedding(self, image: Image.Image) -> np.ndarray:
         """
         Generates an embedding for a given PIL image.
@@ -43,14 +320,32 @@ class CLIPAnalyzer:
         if image.mode != 'RGB':
             image = image.convert('RGB')
 
-        inputs = self.processor(images=image, return_tensors="pt").to(self.device)
-        with torch.no_grad():
-            image_features = self.model.get_image_features(**inputs)
+        return self._encode_images([image]).squeeze()
 
-        # Normalize features
-        image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
+    def get_image_embeddings(self, images: List[Image.Image], batch_size: int = 32) -> np.ndarray:
+        """
+        Generates embeddings for a list of PIL images in mini-batches.
+        Returns an L2-normalised (N, D) float32 matrix, one row per image.
+        """
+        if not self.initialized:
+            raise RuntimeError("CLIPAnalyzer is not initialized. Call .initialize() first.")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        batches = []
+        for start in range(0, len(images), batch_size):
+            # Ensure images are in RGB format
+            batch = [
+                image if image.mode == 'RGB' else image.convert('RGB')
+                for image in images[start:start + batch_size]
+            ]
+
+            batches.append(self._encode_images(batch))
 
-        return image_features.cpu().numpy().squeeze()
+        if not batches:
+            return np.empty((0, self.embedding_dim), dtype=np.float32)
+
+        return np.concatenate(batches, axis=0)
 
     def get_text_embedding(self, text: str) -> np.ndarray:
         """
@@ -59,14 +354,188 @@ class CLIPAnalyzer:
         if not self.initialized:
             raise RuntimeError("CLIPAnalyzer is not initialized. Call .initialize() first.")
         
-        inputs = self.processor(text=text, return_tensors="pt", padding=True, truncation=True).to(self.device)
-        with torch.no_grad():
-            text_features = self.model.get_text_features(**inputs)
+        return self._encode_texts([text]).squeeze()
 
-        # Normalize features
-        text_features = text_features / text_features.norm(p=2, dim=-1, keepdim=True)
+    def get_text_embeddings(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """
+        Generates embeddings for a list of strings in mini-batches.
+        Returns an L2-normalised (N, D) float32 matrix, one row per string.
+        """
+        if not self.initialized:
+            raise RuntimeError("CLIPAnalyzer is not initialized. Call .initialize() first.")
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            batches.append(self._encode_texts(list(texts[start:start + batch_size])))
+
+        if not batches:
+            return np.empty((0, self.embedding_dim), dtype=np.float32)
+
+        return np.concatenate(batches, axis=0)
+
+    def _get_embedding_cache(self) -> EmbeddingCache:
+        if self.embedding_cache is None:
+            self.embedding_cache = EmbeddingCache(self.cache_name)
+        return self.embedding_cache
+
+    def get_prompt_bank(self) -> PromptBank:
+        """Return the zero-shot prompt bank, loading it from disk or encoding it once"""
+        if self.prompt_bank is None:
+            if not self.initialized:
+                raise RuntimeError("CLIPAnalyzer is not initialized. Call .initialize() first.")
+            bank = PromptBank(self.cache_name, PROMPT_SETS, self._get_embedding_cache().cache_dir)
+            self.prompt_bank = bank.load_or_build(self.get_text_embeddings)
+        return self.prompt_bank
+
+    def _get_query_embedding(self, image: Image.Image) -> np.ndarray:
+        """Embed a query image, reusing the result when the same pixels are analysed twice in a row"""
+        rgb = image if image.mode == 'RGB' else image.convert('RGB')
+        digest = hashlib.sha1(rgb.tobytes()).hexdigest()
+
+        with self._cache_lock:
+            last_digest, last_embedding = self._last_query
+        if digest != last_digest:
+            last_embedding = self.get_image_embeddings([rgb])[0]
+            with self._cache_lock:
+                self._last_query = (digest, last_embedding)
+        return last_embedding
+
+    def _zero_shot(self, embeddings: np.ndarray) -> Dict:
+        """Return {prompt set: (labels, (N, L) probabilities)} for embedding rows"""
+        return self.get_prompt_bank().score(embeddings, logit_scale=self.logit_scale)
+
+    def get_zero_shot_labels(self, image: Image.Image) -> Dict[str, Dict[str, float]]:
+        """
+        Scores an image against every zero-shot label with one forward pass and one
+        matrix product. Returns {prompt set: {label: probability}}.
+        """
+        if not self.initialized:
+            raise RuntimeError("CLIPAnalyzer is not initialized. Call .initialize() first.")
+
+        scores = self._zero_shot(self._get_query_embedding(image))
+        return {
+            set_name: {label: float(prob) for label, prob in zip(labels, probabilities[0])}
+            for set_name, (labels, probabilities) in scores.items()
+        }
+
+    def get_semantic_description(self, image: Image.Image) -> str:
+        """
+        Describes the style and colour character of a look with zero-shot CLIP labels.
+        Costs one image forward pass and one small matrix product.
+        """
+        if not self.initialized:
+            raise RuntimeError("CLIPAnalyzer is not initialized. Call .initialize() first.")
+
+        labels = self.get_zero_shot_labels(image)
+        style, style_prob = max(labels['style'].items(), key=lambda entry: entry[1])
+        color_style, color_prob = max(labels['color_style'].items(), key=lambda entry: entry[1])
+        return f"{style} style ({style_prob:.0%}), {color_style} colors ({color_prob:.0%})"
+
+    @staticmethod
+    def _load_item_image(path) -> Optional[Image.Image]:
+        """Open a local item image, or return None if it is missing or unreadable"""
+        if not isinstance(path, str) or not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        try:
+            image = open_image(path, CLIP_DECODE_SIZE)
+            image.load()
+            return image
+        except Exception:
+            return None
+
+    def _get_item_embeddings(self, clothing_list: List[Dict], batch_size: int = 32):
+        """
+        Return ((N, D) item embeddings, (N,) bool mask of items embedded from text).
+
+        Items with a readable local image use the persistent image embedding cache.
+        Others fall back to an embedding of their name and description, kept in
+        memory. Anything new is computed in batches, so a warm catalog runs no
+        model passes at all.
+        """
+        embedding_cache = self._get_embedding_cache()
+        image_paths = list(dict.fromkeys(
+            item.get('image_url') for item in clothing_list if item.get('local_file', False)
+        ))
+        image_embeddings, missing = embedding_cache.lookup(image_paths)
+
+        computed = {}
+        for start in range(0, len(missing), batch_size):
+            batch_paths = []
+            batch_images = []
+            for path in missing[start:start + batch_size]:
+                image = self._load_item_image(path)
+                if image is not None:
+                    batch_paths.append(path)
+                    batch_images.append(image)
+            if batch_images:
+                computed.update(zip(batch_paths, self.get_image_embeddings(batch_images, batch_size=batch_size)))
+        if computed:
+            embedding_cache.update(computed)
+            image_embeddings.update(computed)
 
-        return text_features.cpu().numpy().squeeze()
+        # Everything without a usable image is described by its text
+        from_text = np.array([item.get('image_url') not in image_embeddings for item in clothing_list], dtype=bool)
+        with self._cache_lock:
+            text_embeddings = dict(self._text_embeddings)
+        texts = list(dict.fromkeys(
+            self._item_text(item) for item, use_text in zip(clothing_list, from_text)
+            if use_text and self._item_text(item) not in text_embeddings
+        ))
+        if texts:
+            computed_texts = dict(zip(texts, self.get_text_embeddings(texts)))
+            text_embeddings.update(computed_texts)
+            with self._cache_lock:
+                self._text_embeddings.update(computed_texts)
+
+        rows = [
+            text_embeddings[self._item_text(item)] if use_text else image_embeddings[item.get('image_url')]
+            for item, use_text in zip(clothing_list, from_text)
+        ]
+        return np.stack(rows).astype(np.float32, copy=False), from_text
+
+    @staticmethod
+    def _item_text(item: Dict) -> str:
+        return f"a photo of {item.get('name', '')}, {item.get('description', '')}"
+
+    def find_best_clothing_matches(self, image: Image.Image, clothing_list: List[Dict],
+                                   threshold: float = 0.5, text_match_scale: float = TEXT_MATCH_SCALE) -> List[Dict]:
+        """
+        Scores every clothing item against a look and returns those above threshold,
+        best first. Each result is a copy of the item with 'clip_score',
+        'detected_style' and 'detected_color_style' added. Scores of items without a
+        usable image are multiplied by text_match_scale (see TEXT_MATCH_COSINE).
+        Costs one image forward pass; items are scored with matrix products.
+        """
+        if not self.initialized:
+            raise RuntimeError("CLIPAnalyzer is not initialized. Call .initialize() first.")
+        if not clothing_list:
+            return []
+
+        query = self._get_query_embedding(image)
+        item_embeddings, from_text = self._get_item_embeddings(clothing_list)
+
+        scores = item_embeddings @ query
+        scores[from_text] *= text_match_scale
+        scores = np.clip(scores, 0.0, 1.0)
+
+        zero_shot = self._zero_shot(item_embeddings)
+        style_labels, style_probs = zero_shot['style']
+        color_labels, color_probs = zero_shot['color_style']
+        style_indices = np.argmax(style_probs, axis=1)
+        color_indices = np.argmax(color_probs, axis=1)
+
+        matches = []
+        # Stable sort keeps catalog order among equal scores
+        for i in np.argsort(-scores, kind='stable'):
+            if scores[i] < threshold:
+                break
+            match = dict(clothing_list[i])
+            match['clip_score'] = float(scores[i])
+            match['detected_style'] = style_labels[style_indices[i]]
+            match['detected_color_style'] = color_labels[color_indices[i]]
+            matches.append(match)
+
+        return matches
 
     def calculate_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """
@@ -81,4 +550,15 @@ class CLIPAnalyzer:
         embedding2 = embedding2.flatten()
         
         similarity = np.dot(embedding1, embedding2.T)
-        return float(np.clip(similarity, 0.0, 1.0))
\ No newline at end of file
+        return float(np.clip(similarity, 0.0, 1.0))
+
+
+def _env_int(name):
+    """Read an optional positive integer setting from the environment"""
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def _l2_normalize(features):
+    features = np.asarray(features, dtype=np.float32)
+    return features / np.linalg.norm(features, axis=-1, keepdims=True)
@@ -1,14 +1,164 @@
+import hashlib
+import threading
+from collections import OrderedDict
 import numpy as np
 from PIL import Image
 from sklearn.cluster import KMeans
 from sklearn.metrics.pairwise import euclidean_distances
 import cv2
 
+# Fast extraction: pixel budget before histogramming and bits kept per channel
+FAST_MAX_PIXELS = 250000
+HISTOGRAM_BITS = 5
+FAST_N_INIT = 4
+# Colour naming: bits kept per channel in the RGB -> name lookup table, and the entry
+# of bins that straddle two names and are resolved exactly
+NAME_LUT_BITS = 5
+NAME_LUT_MIXED = 255
+_NAME_LUTS = {}
+# Palettes kept in memory per ColorAnalyzer, keyed by image content, n_colors and method
+PALETTE_CACHE_SIZE = 64
+
+# Reference white D65
+WHITE_D65 = (95.047, 100.000, 108.883)
+
+
+def _gamma_expand(value):
+    """sRGB gamma expansion of one normalised channel value, scaled to 0-100"""
+    if value > 0.04045:
+        value = ((value + 0.055) / 1.055) ** 2.4
+    else:
+        value = value / 12.92
+    return value * 100
+
+
+# Gamma expansion of every 8-bit channel value, computed with the scalar formula
+_LINEAR_BY_BYTE = np.array([_gamma_expand(v) for v in np.arange(256) / 255.0])
+
+
+def _linear_to_xyz(linear):
+    """Apply the sRGB -> XYZ matrix to gamma-expanded values of shape (..., 3)"""
+    r, g, b = linear[..., 0], linear[..., 1], linear[..., 2]
+
+    # Written out term by term so results match the scalar formula exactly
+    x = r * 0.4124 + g * 0.3576 + b * 0.1805
+    y = r * 0.2126 + g * 0.7152 + b * 0.0722
+    z = r * 0.0193 + g * 0.1192 + b * 0.9505
+
+    return np.stack([x, y, z], axis=-1)
+
+
+def rgb_to_xyz_array(rgb):
+    """Convert normalised (0-1) RGB values of shape (..., 3) to XYZ in one pass"""
+    rgb = np.asarray(rgb, dtype=np.float64)
+
+    # Apply gamma correction
+    linear = rgb / 12.92
+    mask = rgb > 0.04045
+    linear[mask] = ((rgb[mask] + 0.055) / 1.055) ** 2.4
+
+    return _linear_to_xyz(linear * 100)
+
+
+def xyz_to_lab_array(xyz):
+    """Convert XYZ values of shape (..., 3) to LAB in one pass"""
+    t = np.asarray(xyz, dtype=np.float64) / np.array(WHITE_D65)
+
+    f = (7.787 * t) + (16 / 116)
+    mask = t > 0.008856
+    f[mask] = t[mask] ** (1 / 3)
+
+    fx, fy, fz = f[..., 0], f[..., 1], f[..., 2]
+    L = 116 * fy - 16
+    a = 500 * (fx - fy)
+    b = 200 * (fy - fz)
+
+    return np.stack([L, a, b], axis=-1)
+
+
+def rgb_to_lab_array(rgb):
+    """Convert 0-255 RGB values of shape (..., 3) to LAB in one pass"""
+    rgb = np.asarray(rgb)
+    if np.issubdtype(rgb.dtype, np.integer):
+        # 8-bit colours take the gamma step from a lookup table
+        xyz = _linear_to_xyz(_LINEAR_BY_BYTE[np.clip(rgb, 0, 255)])
+    else:
+        xyz = rgb_to_xyz_array(rgb / 255.0)
+    return xyz_to_lab_array(xyz)
+
+
+def ciede2000(lab1, lab2):
+    """CIEDE2000 colour difference between broadcastable LAB arrays of shape (..., 3)"""
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+
+    # Rescale a* so that neutral colours keep their chroma
+    c_mean = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    g = 0.5 * (1 - np.sqrt(c_mean ** 7 / (c_mean ** 7 + 25.0 ** 7)))
+    a1p, a2p = (1 + g) * a1, (1 + g) * a2
+    c1p, c2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+    chroma_product = c1p * c2p
+
+    # Hue difference, taking the short way round the circle
+    dhp = h2p - h1p
+    dhp = np.where(dhp > 180, dhp - 360, np.where(dhp < -180, dhp + 360, dhp))
+    dhp = np.where(chroma_product == 0, 0.0, dhp)
+
+    dLp = L2 - L1
+    dCp = c2p - c1p
+    dHp = 2 * np.sqrt(chroma_product) * np.sin(np.radians(dhp) / 2)
+
+    Lp_mean = (L1 + L2) / 2
+    Cp_mean = (c1p + c2p) / 2
+    hp_sum = h1p + h2p
+    hp_mean = np.where(
+        np.abs(h1p - h2p) <= 180, hp_sum / 2,
+        np.where(hp_sum < 360, (hp_sum + 360) / 2, (hp_sum - 360) / 2)
+    )
+    hp_mean = np.where(chroma_product == 0, hp_sum, hp_mean)
+
+    t = (1 - 0.17 * np.cos(np.radians(hp_mean - 30)) + 0.24 * np.cos(np.radians(2 * hp_mean))
+         + 0.32 * np.cos(np.radians(3 * hp_mean + 6)) - 0.20 * np.cos(np.radians(4 * hp_mean - 63)))
+    d_theta = 30 * np.exp(-((hp_mean - 275) / 25) ** 2)
+    r_c = 2 * np.sqrt(Cp_mean ** 7 / (Cp_mean ** 7 + 25.0 ** 7))
+    s_l = 1 + 0.015 * (Lp_mean - 50) ** 2 / np.sqrt(20 + (Lp_mean - 50) ** 2)
+    s_c = 1 + 0.045 * Cp_mean
+    s_h = 1 + 0.015 * Cp_mean * t
+    r_t = -np.sin(np.radians(2 * d_theta)) * r_c
+
+    return np.sqrt(
+        (dLp / s_l) ** 2 + (dCp / s_c) ** 2 + (dHp / s_h) ** 2
+        + r_t * (dCp / s_c) * (dHp / s_h)
+    )
+
+
+class ColorPalette:
+    """Dominant colors of an image with their pixel shares, largest first"""
+
+    def __init__(self, colors, weights, lab):
+        self.colors = colors
+        self.weights = weights
+        self.lab = lab
+
+    def __len__(self):
+        return len(self.colors)
+
+    def __iter__(self):
+        return iter(zip(self.colors, self.weights))
+
+
 class ColorAnalyzer:
     """Handles color extraction and analysis"""
     
     def __init__(self):
         self.color_names = self._load_color_names()
+        self._name_list, self._name_rgb, self._name_lut = self._build_name_lut(self.color_names)
+        self._palette_cache = OrderedDict()
+        self._palette_lock = threading.Lock()
     
     def _load_color_names(self):
         """Load basic color name mappings"""
@@ -35,40 +185,154 @@ class ColorAnalyzer:
             'gold': [255, 215, 0]
         }
     
-    def extract_dominant_colors(self, image, n_colors=5):
-        """Extract dominant colors from an image using K-means clustering"""
+    def extract_dominant_colors(self, image, n_colors=5, method='kmeans'):
+        """
+        Extract dominant colors from an image using K-means clustering.
+
+        method='kmeans' clusters every pixel; method='fast' clusters a coarse colour
+        histogram of (at most FAST_MAX_PIXELS) pixels, weighted by bin counts. The fast
+        palette is approximate and can differ from the full clustering.
+        """
+        return list(self.extract_palette(image, n_colors, method).colors)
+
+    def extract_palette(self, image, n_colors=5, method='kmeans'):
+        """
+        Return the ColorPalette (colors, weights, Lab values) of an image.
+        Results are cached by image content, n_colors and method, so repeated
+        calls for the same image skip the clustering.
+        """
+        pixels = self._image_pixels(image)
+        key = (hashlib.blake2b(np.ascontiguousarray(pixels).data, digest_size=16).hexdigest(),
+               len(pixels), n_colors, method)
+
+        with self._palette_lock:
+            palette = self._palette_cache.get(key)
+            if palette is not None:
+                self._palette_cache.move_to_end(key)
+                return palette
+
+        colors, weights = self._cluster_pixels(pixels, n_colors, method)
+        palette = ColorPalette(
+            colors=list(colors),
+            weights=weights,
+            lab=rgb_to_lab_array(np.asarray(colors).reshape(-1, 3))
+        )
+
+        with self._palette_lock:
+            self._palette_cache[key] = palette
+            while len(self._palette_cache) > PALETTE_CACHE_SIZE:
+                self._palette_cache.popitem(last=False)
+        return palette
+
+    def _image_pixels(self, image):
+        """Flatten an image into an (N, 3) uint8 pixel array"""
         if isinstance(image, Image.Image):
             # Convert PIL to numpy array
             image_array = np.array(image)
         else:
-            image_array = image
-            
+            image_array = np.asarray(image)
+
         # Remove any alpha channel before reshaping
         if image_array.ndim == 3 and image_array.shape[2] == 4:
             image_array = image_array[:, :, :3]
+        elif image_array.ndim == 2:
+            image_array = np.stack([image_array] * 3, axis=-1)
 
         # Reshape image to be a list of pixels
-        pixels = image_array.reshape((-1, 3))
-        
-        # Apply K-means clustering
-        kmeans = KMeans(n_clusters=n_colors, random_state=42, n_init='auto')
-        kmeans.fit(pixels)
-        
-        # Get cluster centers (dominant colors)
+        return image_array.reshape((-1, 3))
+
+    def _cluster_pixels(self, pixels, n_colors, method='kmeans'):
+        """Cluster pixels; returns (colors, percentages) sorted by percentage, largest first"""
+        if method == 'kmeans':
+            kmeans = KMeans(n_clusters=n_colors, random_state=42, n_init='auto')
+            kmeans.fit(pixels)
+            colors = kmeans.cluster_centers_.astype(int)
+            percentages = np.bincount(kmeans.labels_, minlength=n_colors) / len(pixels)
+        elif method == 'fast':
+            colors, percentages = self._cluster_histogram(pixels, n_colors)
+        else:
+            raise ValueError(f"Unknown color extraction method '{method}', expected 'fast' or 'kmeans'")
+
+        order = np.argsort(-percentages, kind='stable')
+        return colors[order], percentages[order]
+
+    def _cluster_histogram(self, pixels, n_colors):
+        """Weighted K-means over the occupied bins of a quantised RGB histogram"""
+        # A strided sample keeps the spatial spread of the image and bounds the work
+        step = -(-len(pixels) // FAST_MAX_PIXELS)
+        if step > 1:
+            pixels = pixels[::step]
+        pixels = pixels.astype(np.int64)
+
+        # Bin index per pixel, then count and mean colour per occupied bin
+        shift = 8 - HISTOGRAM_BITS
+        codes = ((pixels[:, 0] >> shift) << (2 * HISTOGRAM_BITS)) \
+            | ((pixels[:, 1] >> shift) << HISTOGRAM_BITS) | (pixels[:, 2] >> shift)
+        bins, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        bin_colors = np.stack(
+            [np.bincount(inverse, weights=pixels[:, c], minlength=len(bins)) for c in range(3)], axis=1
+        ) / counts[:, None]
+
+        # Fewer distinct bins than clusters: every bin is its own color
+        if len(bins) <= n_colors:
+            return bin_colors.astype(int), counts / counts.sum()
+
+        # Bins are cheap to cluster, so spend a few restarts on avoiding poor local minima
+        kmeans = KMeans(n_clusters=n_colors, random_state=42, n_init=FAST_N_INIT)
+        kmeans.fit(bin_colors, sample_weight=counts)
         colors = kmeans.cluster_centers_.astype(int)
-        
-        # Calculate the percentage of each color
-        labels = kmeans.labels_
-        percentages = []
-        for i in range(n_colors):
-            percentages.append(np.sum(labels == i) / len(labels) if labels is not None else 0)
-        
-        # Sort colors by percentage
-        color_data = list(zip(colors, percentages))
-        color_data.sort(key=lambda x: x[1], reverse=True)
-        
-        return [color for color, _ in color_data]
-    
+        percentages = np.bincount(kmeans.labels_, weights=counts, minlength=n_colors) / counts.sum()
+        return colors, percentages
+
+    def _build_name_lut(self, color_names):
+        """Nearest colour name of every quantised RGB bin, as a flat index table"""
+        # Built once per name table and shared by every ColorAnalyzer
+        key = tuple((name, tuple(rgb)) for name, rgb in color_names.items())
+        if key not in _NAME_LUTS:
+            _NAME_LUTS[key] = self._compute_name_lut(color_names)
+        return _NAME_LUTS[key]
+
+    def _compute_name_lut(self, color_names):
+        names = np.array(list(color_names.keys()))
+        references = np.array(list(color_names.values()), dtype=np.int64)
+
+        # Nearest-name regions are convex, so a bin whose 8 corners share a name has
+        # that name throughout; the other bins are marked for an exact search
+        levels = 1 << NAME_LUT_BITS
+        step = 256 // levels
+        corners = np.stack([np.arange(levels) * step, np.arange(levels) * step + step - 1], axis=1).ravel()
+        # Squared distances of the corner grid, summed per channel: (corner, corner, corner, reference)
+        channel = ((corners[:, None, None] - references[None, :, :]) ** 2).astype(np.int32)
+        distances = (channel[:, None, None, :, 0] + channel[None, :, None, :, 1]) + channel[None, None, :, :, 2]
+        nearest = np.argmin(distances, axis=-1).reshape(levels, 2, levels, 2, levels, 2)
+        nearest = nearest.transpose(0, 2, 4, 1, 3, 5).reshape(levels ** 3, 8)
+
+        lut = np.where((nearest == nearest[:, :1]).all(axis=1), nearest[:, 0], NAME_LUT_MIXED)
+        return names, references, lut.astype(np.uint8)
+
+    @staticmethod
+    def _nearest_names(rgb, references):
+        """Index of the nearest reference colour of each RGB value, first one on ties"""
+        distances = ((rgb[:, None, :] - references[None, :, :]) ** 2).sum(axis=-1)
+        return np.argmin(distances, axis=1)
+
+    def get_color_names(self, rgb_colors):
+        """
+        Get the closest color name for each RGB value in an (N, 3) array with one table lookup.
+        Rounded to integer RGB, the names equal get_color_name.
+        """
+        rgb = np.clip(np.rint(np.asarray(rgb_colors, dtype=np.float64)), 0, 255).astype(np.int64).reshape(-1, 3)
+        bins = rgb >> (8 - NAME_LUT_BITS)
+        index = (bins[:, 0] << (2 * NAME_LUT_BITS)) | (bins[:, 1] << NAME_LUT_BITS) | bins[:, 2]
+        nearest = self._name_lut[index].astype(np.intp)
+
+        # Colours in bins that straddle two names
+        mixed = nearest == NAME_LUT_MIXED
+        if mixed.any():
+            nearest[mixed] = self._nearest_names(rgb[mixed], self._name_rgb)
+        return self._name_list[nearest]
+
     def get_color_name(self, rgb_color):
         """Get the closest color name for an RGB value"""
         min_distance = float('inf')
@@ -84,131 +348,108 @@ class ColorAnalyzer:
     
     def calculate_color_similarity(self, color1, color2):
         """Calculate similarity between two colors (0-1, higher is more similar)"""
-        # Convert to LAB color space for perceptual color difference
-        color1_lab = self.rgb_to_lab(np.array(color1))
-        color2_lab = self.rgb_to_lab(np.array(color2))
-        
-        # Calculate deltaE (CIE76)
-        delta_e = np.sqrt(
-            (color1_lab[0] - color2_lab[0]) ** 2 +
-            (color1_lab[1] - color2_lab[1]) ** 2 +
-            (color1_lab[2] - color2_lab[2]) ** 2
-        )
-        
-        # Convert to similarity score (0-1)
-        # DeltaE of 100 is considered very different, 0 is identical
-        similarity = max(0, 1 - (delta_e / 100))
-        
-        return similarity
+        # CIE76 deltaE in LAB space; a deltaE of 100 is considered very different, 0 is identical
+        return float(self.color_similarity_matrix([color1], [color2])[0, 0])
+    
+    def delta_e_matrix(self, colors1, colors2, method='cie76'):
+        """
+        Colour differences between every pair of two RGB colour lists.
+        Returns an (M, N) array; method is 'cie76' (as calculate_color_similarity) or 'ciede2000'.
+        """
+        lab1 = rgb_to_lab_array(np.asarray(colors1).reshape(-1, 3))[:, None, :]
+        lab2 = rgb_to_lab_array(np.asarray(colors2).reshape(-1, 3))[None, :, :]
+
+        if method == 'cie76':
+            return np.sqrt(
+                (lab1[..., 0] - lab2[..., 0]) ** 2 +
+                (lab1[..., 1] - lab2[..., 1]) ** 2 +
+                (lab1[..., 2] - lab2[..., 2]) ** 2
+            )
+        if method == 'ciede2000':
+            return ciede2000(lab1, lab2)
+        raise ValueError(f"Unknown deltaE method '{method}', expected 'cie76' or 'ciede2000'")
+
+    def color_similarity_matrix(self, colors1, colors2, method='cie76'):
+        """Pairwise similarity (0-1) of two RGB colour lists as an (M, N) array"""
+        return np.maximum(0, 1 - self.delta_e_matrix(colors1, colors2, method) / 100)
     
     def rgb_to_lab(self, rgb):
         """Convert RGB to LAB color space"""
-        # Normalize RGB values
-        rgb_normalized = np.array(rgb) / 255.0
-        
-        # Convert to XYZ first
-        xyz = self.rgb_to_xyz(rgb_normalized)
-        
-        # Convert XYZ to LAB
-        lab = self.xyz_to_lab(xyz)
-        
-        return lab
+        return rgb_to_lab_array(np.asarray(rgb)).tolist()
     
     def rgb_to_xyz(self, rgb):
         """Convert RGB to XYZ color space"""
-        # Apply gamma correction
-        rgb_corrected = []
-        for value in rgb:
-            if value > 0.04045:
-                value = ((value + 0.055) / 1.055) ** 2.4
-            else:
-                value = value / 12.92
-            rgb_corrected.append(value * 100)
-        
-        r, g, b = rgb_corrected
-        
-        # Apply transformation matrix
-        x = r * 0.4124 + g * 0.3576 + b * 0.1805
-        y = r * 0.2126 + g * 0.7152 + b * 0.0722
-        z = r * 0.0193 + g * 0.1192 + b * 0.9505
-        
-        return [x, y, z]
+        return rgb_to_xyz_array(np.asarray(rgb)).tolist()
     
     def xyz_to_lab(self, xyz):
         """Convert XYZ to LAB color space"""
-        # Reference white D65
-        xn, yn, zn = 95.047, 100.000, 108.883
-        
-        x, y, z = xyz
-        x = x / xn
-        y = y / yn
-        z = z / zn
-        
-        # Apply lab transformation
-        def f(t):
-            if t > 0.008856:
-                return t ** (1/3)
-            else:
-                return (7.787 * t) + (16/116)
-        
-        fx = f(x)
-        fy = f(y)
-        fz = f(z)
-        
-        L = 116 * fy - 16
-        a = 500 * (fx - fy)
-        b = 200 * (fy - fz)
-        
-        return [L, a, b]
+        return xyz_to_lab_array(np.asarray(xyz)).tolist()
+    
+    def get_hues(self, colors):
+        """OpenCV hues (0-179) of RGB colours of shape (..., 3), converted in one cvtColor call"""
+        colors = np.asarray(colors)
+        pixels = np.clip(colors, 0, 255).astype(np.uint8).reshape(1, -1, 3)
+        hues = cv2.cvtColor(pixels, cv2.COLOR_RGB2HSV)[0, :, 0]
+        return hues.astype(np.int16).reshape(colors.shape[:-1])
     
     def analyze_color_harmony(self, colors):
         """Analyze color harmony relationships"""
         if len(colors) < 2:
             return "monochromatic"
+        return str(self.analyze_color_harmony_batch(np.asarray(colors)[None])[0])
+    
+    def analyze_color_harmony_batch(self, outfits):
+        """
+        Classify the colour harmony of many colour sets at once.
+        outfits is a (B, K, 3) array of B sets of K RGB colours; returns B harmony names.
+        """
+        outfits = np.asarray(outfits)
+        n_outfits, n_colors = outfits.shape[:2]
+        if n_colors < 2:
+            return np.full(n_outfits, "monochromatic", dtype=object)
         
         # Convert colors to HSV for easier harmony analysis
-        hsv_colors = []
-        for color in colors:
-            color_array = np.uint8([[np.array(color)]])
-            hsv = cv2.cvtColor(color_array, cv2.COLOR_RGB2HSV)[0][0]
-            hsv_colors.append(hsv)
-        
-        hues = [hsv[0] for hsv in hsv_colors]
-        
-        # Analyze hue relationships
-        hue_differences = []
-        for i in range(len(hues)):
-            for j in range(i + 1, len(hues)):
-                diff = abs(hues[i] - hues[j])
-                # Handle circular nature of hue
-                diff = min(diff, 360 - diff)
-                hue_differences.append(diff)
+        hues = self.get_hues(outfits)
         
-        avg_hue_diff = np.mean(hue_differences)
+        # Pairwise hue differences, each unordered pair once
+        rows, cols = np.triu_indices(n_colors, k=1)
+        diff = np.abs(hues[:, rows] - hues[:, cols])
+        # Handle circular nature of hue (on OpenCV's 0-179 scale this never wraps, as before)
+        diff = np.minimum(diff, 360 - diff)
+        avg_hue_diff = diff.sum(axis=1) / len(rows)
         
+        return self._classify_hue_difference(avg_hue_diff)
+    
+    def hue_harmony_table(self):
+        """(180, 180) table of the harmony of two colours indexed by their OpenCV hues"""
+        hues = np.arange(180)
+        diff = np.abs(hues[:, None] - hues[None, :])
+        return self._classify_hue_difference(np.minimum(diff, 360 - diff))
+    
+    def _classify_hue_difference(self, avg_hue_diff):
+        """Harmony name for each average hue difference"""
         # Classify harmony type
-        if avg_hue_diff < 30:
-            return "analogous"
-        elif 60 <= avg_hue_diff <= 120:
-            return "triadic"
-        elif 150 <= avg_hue_diff <= 210:
-            return "complementary"
-        else:
-            return "complex"
+        return np.select(
+            [avg_hue_diff < 30,
+             (avg_hue_diff >= 60) & (avg_hue_diff <= 120),
+             (avg_hue_diff >= 150) & (avg_hue_diff <= 210)],
+            ["analogous", "triadic", "complementary"],
+            default="complex"
+        ).astype(object)
     
     def get_color_temperature(self, rgb_color):
         """Determine if a color is warm or cool"""
-        r, g, b = rgb_color
+        return str(self.get_color_temperatures([rgb_color])[0])
+    
+    def get_color_temperatures(self, rgb_colors):
+        """Warm/cool/neutral for every RGB colour of shape (..., 3) in one pass"""
+        rgb = np.asarray(rgb_colors, dtype=np.float64)
+        r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
         
         # Simple heuristic: more red/yellow = warm, more blue = cool
         warm_score = (r + (g * 0.5)) - b
         
-        if warm_score > 50:
-            return "warm"
-        elif warm_score < -50:
-            return "cool"
-        else:
-            return "neutral"
+        return np.select([warm_score > 50, warm_score < -50], ["warm", "cool"], default="neutral")
     
     def calculate_color_contrast(self, color1, color2):
         """Calculate contrast ratio between two colors"""
@@ -0,0 +1,131 @@
+import json
+import os
+import re
+import threading
+import numpy as np
+
+from utils.file_store import FileHashIndex, write_new_file, write_json_atomic, remove_files, remove_stale_files
+
+
+def model_slug(model_name):
+    """Turn a Hugging Face model id into a safe directory name"""
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', model_name)
+
+
+class EmbeddingCache:
+    """
+    On-disk store of image embeddings keyed by image content hash and model name.
+
+    Embeddings for one model live in a single matrix file plus a JSON index that
+    maps content hashes to rows, so a warm catalog loads with two file reads. Each
+    save writes a new, uniquely named matrix and then swaps in the index naming it,
+    so the index and the matrix it is read with always match.
+    Image paths are hashed through a FileHashIndex.
+    """
+    def __init__(self, model_name: str, cache_dir: str = "cache/embeddings"):
+        self.model_name = model_name
+        self.cache_dir = os.path.join(cache_dir, model_slug(model_name))
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.hashes_path = os.path.join(self.cache_dir, "file_hashes.json")
+
+        self._rows = {}
+        self._matrix = None
+        self._matrix_file = None
+        self._file_hashes = FileHashIndex()
+        self._dirty = False
+        # Shared between app sessions; update() must hand out each row number once
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        """Load the embedding matrix and indexes if they exist"""
+        try:
+            if os.path.exists(self.index_path):
+                with open(self.index_path) as f:
+                    index = json.load(f)
+                if index.get('model_name') == self.model_name:
+                    # Caches saved before versioned matrices used a fixed name
+                    self._matrix_file = index.get('matrix_file', 'embeddings.npy')
+                    self._matrix = np.load(os.path.join(self.cache_dir, self._matrix_file))
+                    self._rows = index['rows']
+            if os.path.exists(self.hashes_path):
+                with open(self.hashes_path) as f:
+                    self._file_hashes = FileHashIndex(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Ignoring unreadable embedding cache in {self.cache_dir}. Error: {e}")
+            self._rows, self._matrix, self._matrix_file, self._file_hashes = {}, None, None, FileHashIndex()
+
+    def content_hash(self, path):
+        """Return the SHA-256 of a file's bytes, or None if it cannot be read"""
+        with self._lock:
+            return self._file_hashes.content_hash(path)
+
+    def get(self, content_hash):
+        """Return the cached embedding for a content hash, or None"""
+        with self._lock:
+            row = self._rows.get(content_hash)
+            if row is None:
+                return None
+            return self._matrix[row]
+
+    def lookup(self, paths):
+        """
+        Split image paths into cached embeddings and paths that still need the model.
+        Returns ({path: embedding}, [missing paths]).
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for path in paths:
+                content_hash = self.content_hash(path)
+                embedding = self.get(content_hash) if content_hash else None
+                if embedding is None:
+                    missing.append(path)
+                else:
+                    found[path] = embedding
+        return found, missing
+
+    def update(self, embeddings_by_path):
+        """Store freshly computed embeddings for image paths and persist the cache"""
+        with self._lock:
+            new_hashes = []
+            new_rows = []
+            for path, embedding in embeddings_by_path.items():
+                content_hash = self.content_hash(path)
+                if content_hash is None or content_hash in self._rows or content_hash in new_hashes:
+                    continue
+                new_hashes.append(content_hash)
+                new_rows.append(np.asarray(embedding, dtype=np.float32))
+
+            if new_rows:
+                start = 0 if self._matrix is None else len(self._matrix)
+                new_matrix = np.stack(new_rows)
+                self._matrix = new_matrix if self._matrix is None else np.concatenate([self._matrix, new_matrix])
+                for offset, content_hash in enumerate(new_hashes):
+                    self._rows[content_hash] = start + offset
+                self._dirty = True
+
+            self.save()
+
+    def save(self):
+        """Write the cache to disk atomically if anything changed"""
+        with self._lock:
+            if not (self._dirty or self._file_hashes.dirty):
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            if self._matrix is not None and self._dirty:
+                matrix = self._matrix
+                matrix_file = write_new_file(self.cache_dir, 'embeddings-', '.npy', lambda f: np.save(f, matrix))
+                write_json_atomic(self.index_path, {
+                    'model_name': self.model_name, 'rows': self._rows, 'matrix_file': matrix_file
+                })
+                remove_files(self.cache_dir, [self._matrix_file], keep=(matrix_file,))
+                remove_stale_files(self.cache_dir, 'embeddings-', keep=(matrix_file,))
+                self._matrix_file = matrix_file
+
+            write_json_atomic(self.hashes_path, self._file_hashes.entries)
+            self._dirty = self._file_hashes.dirty = False
+
+    def __len__(self):
+        return len(self._rows)
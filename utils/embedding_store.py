@@ -0,0 +1,131 @@
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+from utils.embedding_cache import model_slug
+from utils.file_store import write_new_file, write_json_atomic, read_json, remove_files, remove_stale_files
+from utils.retrieval import partition_by_category
+
+
+class CatalogEmbeddingStore:
+    """
+    Catalog embeddings stored as one contiguous .npy matrix plus a metadata side table.
+
+    The matrix is opened memory-mapped and read-only, so every worker process on the
+    host shares the same page-cache pages instead of holding its own copy. Row i of
+    the matrix belongs to row i of the metadata table. Rows are stored grouped by
+    category, so each category is one contiguous slice of both (see category_slices).
+
+    Every build writes a new, uniquely named matrix and metadata file and then swaps
+    in the manifest that names them, so readers always get a matching set.
+    """
+    METADATA_COLUMNS = ['name', 'category', 'primary_color', 'style', 'description', 'image_url']
+
+    def __init__(self, model_name: str, store_dir: str = "cache/catalog", dtype=np.float32):
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.dtype(np.float32), np.dtype(np.float16)):
+            raise ValueError("dtype must be float32 or float16")
+
+        self.store_dir = os.path.join(store_dir, model_slug(model_name))
+        self.manifest_path = os.path.join(self.store_dir, "manifest.json")
+        self.manifest = None
+
+    @staticmethod
+    def catalog_fingerprint(paths, content_hashes):
+        """Hash the ordered (path, content hash) pairs that make up a catalog"""
+        digest = hashlib.sha256()
+        for path, content_hash in zip(paths, content_hashes):
+            digest.update(f"{path}\0{content_hash or 'none'}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def _read_manifest(self):
+        return read_json(self.manifest_path)
+
+    def _stored_file(self, manifest, key):
+        return os.path.join(self.store_dir, manifest[key])
+
+    def is_current(self, fingerprint):
+        """Check whether the stored matrix was built for this model, dtype and catalog"""
+        manifest = self._read_manifest()
+        return (
+            manifest is not None
+            and manifest.get('model_name') == self.model_name
+            and manifest.get('dtype') == self.dtype.name
+            and manifest.get('fingerprint') == fingerprint
+            and 'category_slices' in manifest
+            and 'matrix_file' in manifest
+            and os.path.exists(self._stored_file(manifest, 'matrix_file'))
+            and os.path.exists(self._stored_file(manifest, 'metadata_file'))
+        )
+
+    def build(self, products_df, embeddings, fingerprint):
+        """
+        Write the catalog matrix and metadata table, replacing any previous build.
+        Products are reordered so every category is contiguous; the stored row order
+        is therefore not the order of products_df.
+        """
+        embeddings = np.asarray(embeddings)
+        if embeddings.ndim != 2 or len(embeddings) != len(products_df):
+            raise ValueError("embeddings must be an (N, D) matrix with one row per product")
+
+        order, category_slices = partition_by_category(products_df['category'].to_numpy())
+        embeddings = np.ascontiguousarray(embeddings[order], dtype=self.dtype)
+        products_df = products_df.iloc[order]
+
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        # Write the new matrix and metadata under names no other build uses; readers
+        # keep seeing the previous files until the manifest points at these
+        matrix_file = write_new_file(self.store_dir, 'embeddings-', '.npy', lambda f: np.save(f, embeddings))
+        columns = [c for c in self.METADATA_COLUMNS if c in products_df.columns]
+        metadata_file = write_new_file(
+            self.store_dir, 'metadata-', '.csv',
+            lambda f: products_df[columns].reset_index(drop=True).to_csv(f, index_label='row')
+        )
+
+        previous = self._read_manifest() or {}
+        write_json_atomic(self.manifest_path, {
+            'model_name': self.model_name,
+            'dtype': self.dtype.name,
+            'shape': list(embeddings.shape),
+            'fingerprint': fingerprint,
+            'matrix_file': matrix_file,
+            'metadata_file': metadata_file,
+            'category_slices': {category: [part.start, part.stop] for category, part in category_slices.items()}
+        })
+        # Stores that already opened the previous files keep their memory map
+        # (builds before versioned files used fixed names)
+        remove_files(self.store_dir, [previous.get('matrix_file', 'embeddings.npy'),
+                                      previous.get('metadata_file', 'metadata.csv')],
+                     keep=(matrix_file, metadata_file))
+        for prefix in ('embeddings-', 'metadata-', 'manifest.json.'):
+            remove_stale_files(self.store_dir, prefix, keep=(matrix_file, metadata_file))
+
+    def open(self):
+        """
+        Open the stored catalog.
+        Returns (read-only np.memmap of shape (N, D), metadata DataFrame indexed by row).
+        category_slices() then describes these rows, even if a rebuild swaps in a new catalog.
+        """
+        for attempt in range(2):
+            manifest = self._read_manifest()
+            if manifest is None or 'matrix_file' not in manifest:
+                raise FileNotFoundError(f"No catalog embeddings stored in {self.store_dir}")
+            try:
+                embeddings = np.load(self._stored_file(manifest, 'matrix_file'), mmap_mode='r')
+                metadata = pd.read_csv(self._stored_file(manifest, 'metadata_file'), index_col='row')
+                break
+            except FileNotFoundError:
+                # A rebuild replaced the files between reading the manifest and opening them
+                if attempt:
+                    raise
+        self.manifest = manifest
+        return embeddings, metadata
+
+    def category_slices(self):
+        """{category: slice} of the opened rows (else the stored ones), or {} if nothing is stored"""
+        manifest = self.manifest or self._read_manifest() or {}
+        return {category: slice(start, stop)
+                for category, (start, stop) in manifest.get('category_slices', {}).items()}
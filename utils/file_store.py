@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+class FileHashIndex:
+    """
+    SHA-256 of image files' bytes, shared by the on-disk caches keyed by content.
+
+    A stat index (path, size, mtime) avoids re-hashing unchanged files; entries is
+    that index as a JSON-serialisable dict and dirty marks unsaved changes.
+    """
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+        self.dirty = False
+
+    def content_hash(self, path):
+        """Return the SHA-256 of a file's bytes, or None if it cannot be read"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_size == 0:
+            return None
+
+        key = os.path.abspath(path)
+        cached = self.entries.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+
+        self.entries[key] = [stat.st_size, stat.st_mtime_ns, content_hash]
+        self.dirty = True
+        return content_hash
+
+
+def write_new_file(directory, prefix, suffix, write):
+    """
+    Create a file with a unique name in directory, fill it with write(binary file)
+    and return its name. Concurrent writers never share a file this way.
+    """
+    fd, path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix=suffix)
+    try:
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+    except BaseException:
+        remove_files(directory, [os.path.basename(path)])
+        raise
+    return os.path.basename(path)
+
+
+def write_json_atomic(path, data):
+    """Write data as JSON so readers see either the old or the new file"""
+    directory = os.path.dirname(path) or '.'
+    tmp_name = write_new_file(directory, os.path.basename(path) + '.', '.tmp',
+                              lambda f: f.write(json.dumps(data).encode('utf-8')))
+    os.replace(os.path.join(directory, tmp_name), path)
+
+
+def read_json(path):
+    """Parsed JSON file, or None if it is missing or unreadable"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def remove_files(directory, names, keep=()):
+    """Delete the named files in directory, except those in keep, ignoring missing ones"""
+    for name in names:
+        if name and name not in keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def remove_stale_files(directory, prefix, keep=(), max_age=3600):
+    """
+    Delete files starting with prefix that are not in keep and older than max_age seconds.
+    Cleans up after writers that lost a race to swap in their file.
+    """
+    cutoff = time.time() - max_age
+    for entry in os.scandir(directory):
+        if entry.name.startswith(prefix) and entry.name not in keep:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
@@ -1,7 +1,8 @@
+import hashlib
 import os
 import pandas as pd
-from PIL import Image
 import streamlit as st
+from utils.image_processing import open_image
 
 class ImageLoader:
     """Handles loading clothing and inspiration images from local directories"""
@@ -61,6 +62,31 @@ class ImageLoader:
         
         return pd.DataFrame(product_items) if product_items else pd.DataFrame()
     
+    def products_fingerprint(self):
+        """
+        Hash of the product images (path, size, mtime) in the directory that
+        load_products_from_directory reads, or None if there is none.
+        Changes whenever a product image is added, removed or modified.
+        """
+        for base_dir in [self.products_dir, self.clothing_dir]:
+            if os.path.exists(base_dir):
+                break
+        else:
+            return None
+        
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(base_dir):
+            dirs.sort()
+            for filename in sorted(files):
+                if any(filename.endswith(ext) for ext in self.supported_formats):
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+        return digest.hexdigest()
+    
     def load_clothing_from_directory(self):
         """Legacy method - redirects to load_products_from_directory"""
         return self.load_products_from_directory()
@@ -171,11 +197,14 @@ class ImageLoader:
         """Legacy method - redirects to load_user_looks"""
         return self.load_user_looks()
     
-    def get_image_from_path(self, image_path):
-        """Load and return PIL Image from local path"""
+    def get_image_from_path(self, image_path, draft_size=None):
+        """
+        Load and return PIL Image from local path.
+        draft_size=(w, h) decodes JPEGs at the smallest resolution covering that size.
+        """
         try:
             if os.path.exists(image_path):
-                return Image.open(image_path)
+                return open_image(image_path, draft_size)
             else:
                 return None
         except Exception as e:
@@ -3,6 +3,27 @@ import numpy as np
 from PIL import Image
 import io
 
+# Smallest decode size each consumer needs: ImageProcessor and CLIP work at 224x224,
+# the colour analyser samples at most ~250k pixels, catalog thumbnails show at 120px
+FEATURE_DECODE_SIZE = (224, 224)
+CLIP_DECODE_SIZE = (224, 224)
+COLOR_DECODE_SIZE = (512, 512)
+THUMBNAIL_DECODE_SIZE = (240, 240)
+
+
+def open_image(source, draft_size=None):
+    """
+    Open an image from a path or file object.
+    With draft_size=(w, h), JPEGs decode straight to the smallest DCT scale (1/2, 1/4
+    or 1/8) that still covers that size, cutting decode time and memory for big
+    photos. Other formats are opened at full size.
+    """
+    image = Image.open(source)
+    if draft_size is not None and image.format == 'JPEG':
+        image.draft(None, draft_size)
+    return image
+
+
 class ImageProcessor:
     """Handles image processing and feature extraction"""
     
@@ -22,18 +43,26 @@ class ImageProcessor:
         
         return resized
     
-    def extract_style_features(self, image):
-        """Extract style-related features from the image"""
+    def prepare_image(self, image):
+        """
+        Resized BGR image with its grey, HSV and Canny edge images, as a tuple.
+        Pass it as prepared= to the extractors below to convert the image only once.
+        """
         opencv_image = self.preprocess_image(image)
-        
-        # Convert to different color spaces for analysis
+        gray = cv2.cvtColor(opencv_image, cv2.COLOR_BGR2GRAY)
         hsv = cv2.cvtColor(opencv_image, cv2.COLOR_BGR2HSV)
-        lab = cv2.cvtColor(opencv_image, cv2.COLOR_BGR2LAB)
-        
+        edges = cv2.Canny(gray, 50, 150)
+        return opencv_image, gray, hsv, edges
+    
+    def extract_style_features(self, image, prepared=None):
+        """Extract style-related features from the image"""
+        return self._style_features(*(prepared or self.prepare_image(image)))
+    
+    def _style_features(self, opencv_image, gray, hsv, edges):
+        """Style features from the resized BGR image and its grey, HSV and Canny edge images"""
         features = {}
         
         # Calculate brightness and contrast
-        gray = cv2.cvtColor(opencv_image, cv2.COLOR_BGR2GRAY)
         features['brightness'] = np.mean(gray)
         features['contrast'] = np.std(gray)
         
@@ -41,7 +70,6 @@ class ImageProcessor:
         features['saturation'] = np.mean(hsv[:, :, 1])
         
         # Detect edges for pattern analysis
-        edges = cv2.Canny(gray, 50, 150)
         features['edge_density'] = np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
         
         # Analyze texture using LBP-like approach
@@ -54,14 +82,14 @@ class ImageProcessor:
     
     def calculate_texture_complexity(self, gray_image):
         """Calculate texture complexity using gradient analysis"""
-        # Calculate gradients
-        grad_x = cv2.Sobel(gray_image, cv2.CV_64F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(gray_image, cv2.CV_64F, 0, 1, ksize=3)
+        # Calculate gradients (3x3 Sobel of 8-bit input is exact in float32)
+        grad_x = cv2.Sobel(gray_image, cv2.CV_32F, 1, 0, ksize=3)
+        grad_y = cv2.Sobel(gray_image, cv2.CV_32F, 0, 1, ksize=3)
         
         # Calculate magnitude
-        magnitude = np.sqrt(grad_x**2 + grad_y**2)
+        magnitude = cv2.magnitude(grad_x, grad_y)
         
-        return np.mean(magnitude)
+        return np.mean(magnitude, dtype=np.float64)
     
     def calculate_color_variance(self, image):
         """Calculate color variance across the image"""
@@ -75,12 +103,82 @@ class ImageProcessor:
         
         return np.mean(variances)
     
-    def detect_clothing_regions(self, image):
+    def stack_images(self, images):
+        """Preprocess images into an (N, H, W, 3) uint8 BGR stack at target_size"""
+        if not images:
+            return np.empty((0, self.target_size[1], self.target_size[0], 3), dtype=np.uint8)
+        return np.stack([self.preprocess_image(image)[:, :, :3] for image in images])
+    
+    def extract_style_features_batch(self, images, chunk_size=64):
+        """
+        Style features for many images at once.
+        images is an (N, H, W, 3) uint8 BGR stack (see stack_images) or a list of images;
+        returns a dict mapping each extract_style_features key to an (N,) array.
+        """
+        if not isinstance(images, np.ndarray):
+            images = self.stack_images(images)
+        
+        chunks = [self._style_features_chunk(images[start:start + chunk_size])
+                  for start in range(0, len(images), chunk_size)]
+        keys = ['brightness', 'contrast', 'saturation', 'edge_density', 'texture_complexity', 'color_variance']
+        if not chunks:
+            return {key: np.empty(0) for key in keys}
+        return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in keys}
+    
+    def _style_features_chunk(self, stack):
+        """Vectorised style features for one (n, H, W, 3) BGR chunk"""
+        n, height, width = stack.shape[:3]
+        
+        # Colour conversions are per pixel, so one call on the images stacked vertically is exact
+        tall = stack.reshape(n * height, width, 3)
+        gray = cv2.cvtColor(tall, cv2.COLOR_BGR2GRAY).reshape(n, height, width)
+        saturation = cv2.cvtColor(tall, cv2.COLOR_BGR2HSV)[:, :, 1].reshape(n, height, width)
+        
+        # Canny's hysteresis would link edges across image borders, so it runs per image
+        edge_pixels = np.array([np.count_nonzero(cv2.Canny(image, 50, 150)) for image in gray])
+        
+        mean_gray, var_gray = self._moments(gray.reshape(n, -1))
+        mean_sat, _ = self._moments(saturation.reshape(n, -1))
+        # Channel-planar copy so every reduction runs along contiguous memory
+        planar = np.ascontiguousarray(stack.transpose(0, 3, 1, 2)).reshape(n * 3, -1)
+        _, var_bgr = self._moments(planar)
+        
+        return {
+            'brightness': mean_gray,
+            'contrast': np.sqrt(var_gray),
+            'saturation': mean_sat,
+            'edge_density': edge_pixels / (height * width),
+            'texture_complexity': self._sobel_magnitude_mean(gray),
+            'color_variance': var_bgr.reshape(n, 3).mean(axis=1)
+        }
+    
+    def _moments(self, pixels):
+        """Per-row mean and variance of an (n, P) uint8 array, from exact integer sums"""
+        count = pixels.shape[1]
+        total = pixels.sum(axis=1, dtype=np.int64)
+        squares = pixels.astype(np.uint16)
+        squares *= squares
+        total_sq = squares.sum(axis=1, dtype=np.int64)
+        return total / count, (count * total_sq - total * total) / (count * count)
+    
+    def _sobel_magnitude_mean(self, gray):
+        """Mean 3x3 Sobel gradient magnitude per image of an (n, H, W) stack"""
+        n, height, width = gray.shape
+        
+        # Pad every image with OpenCV's default BORDER_REFLECT_101 (numpy's 'reflect'), then
+        # run one Sobel over the padded images stacked vertically: the 3x3 kernel never
+        # reaches past an image's own padding, so the interiors equal per-image cv2.Sobel
+        padded = np.pad(gray, ((0, 0), (1, 1), (1, 1)), mode='reflect').reshape(n * (height + 2), width + 2)
+        grad_x = cv2.Sobel(padded, cv2.CV_32F, 1, 0, ksize=3)
+        grad_y = cv2.Sobel(padded, cv2.CV_32F, 0, 1, ksize=3)
+        
+        magnitude = cv2.magnitude(grad_x, grad_y).reshape(n, height + 2, width + 2)[:, 1:-1, 1:-1]
+        return magnitude.mean(axis=(1, 2), dtype=np.float64)
+    
+    def detect_clothing_regions(self, image, prepared=None):
         """Detect potential clothing regions in the image"""
-        opencv_image = self.preprocess_image(image)
-        
-        # Convert to HSV for better color segmentation
-        hsv = cv2.cvtColor(opencv_image, cv2.COLOR_BGR2HSV)
+        # The HSV image is used for better color segmentation
+        opencv_image, gray, hsv, edges = prepared or self.prepare_image(image)
         
         # Create masks for different clothing regions
         regions = {}
@@ -99,15 +197,18 @@ class ImageProcessor:
         
         return regions
     
-    def extract_pattern_features(self, image):
+    def extract_pattern_features(self, image, prepared=None):
         """Extract pattern-related features"""
-        gray = cv2.cvtColor(self.preprocess_image(image), cv2.COLOR_BGR2GRAY)
-        
+        opencv_image, gray, hsv, edges = prepared or self.prepare_image(image)
+        return self._pattern_features(gray, edges)
+    
+    def _pattern_features(self, gray, edges):
+        """Pattern features from the resized grey image and its Canny edge image"""
         features = {}
         
         # Detect lines (for stripes)
         lines = cv2.HoughLinesP(
-            cv2.Canny(gray, 50, 150), 
+            edges, 
             1, 
             np.pi/180, 
             threshold=50, 
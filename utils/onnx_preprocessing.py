@@ -0,0 +1,92 @@
+import json
+import os
+import numpy as np
+from PIL import Image
+
+# Files tools/export_clip_onnx.py writes next to the towers for this processor
+PREPROCESSING_FILE = "preprocessing.json"
+TOKENIZER_FILE = "tokenizer.json"
+
+_RESAMPLE = {
+    'nearest': Image.NEAREST,
+    'bilinear': Image.BILINEAR,
+    'bicubic': Image.BICUBIC,
+    'lanczos': Image.LANCZOS
+}
+
+
+class ClipOnnxProcessor:
+    """
+    CLIP preprocessing for the ONNX backend with only numpy, PIL and tokenizers.
+
+    Called like the transformers CLIP processor with return_tensors="np":
+    images are resized on their shortest edge, centre cropped, rescaled and
+    normalised with the constants saved at export time, and texts are tokenised
+    with the exported tokenizer.json, so transformers is never imported.
+    """
+    def __init__(self, export_dir: str):
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(export_dir, PREPROCESSING_FILE)) as f:
+            config = json.load(f)
+        self.shortest_edge = config['shortest_edge']
+        self.crop_size = tuple(config['crop_size'])
+        self.resample = _RESAMPLE[config['resample']]
+        self.rescale_factor = config['rescale_factor']
+        self.image_mean = np.array(config['image_mean'], dtype=np.float32)
+        self.image_std = np.array(config['image_std'], dtype=np.float32)
+
+        # Truncation keeps the end-of-text token, like the transformers tokenizer
+        self.tokenizer = Tokenizer.from_file(os.path.join(export_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(config['max_length'])
+        self.tokenizer.enable_padding(pad_id=config['pad_token_id'], pad_token=config['pad_token'])
+
+    @staticmethod
+    def available(export_dir: str) -> bool:
+        """Check whether an export has the files this processor needs"""
+        return (os.path.exists(os.path.join(export_dir, PREPROCESSING_FILE))
+                and os.path.exists(os.path.join(export_dir, TOKENIZER_FILE)))
+
+    def __call__(self, images=None, text=None, return_tensors="np", **kwargs):
+        """Preprocess images or texts; texts are always truncated and padded to the longest"""
+        if return_tensors != "np":
+            raise ValueError("ClipOnnxProcessor only returns numpy arrays")
+        if images is not None:
+            return {'pixel_values': np.stack([self._pixel_values(image) for image in images])}
+        return self._tokenize(text)
+
+    def _pixel_values(self, image):
+        """(3, H, W) float32 CLIP input for one PIL image"""
+        image = image.convert('RGB')
+        width, height = image.size
+
+        # Resize so the shortest edge matches, keeping the aspect ratio
+        if width <= height:
+            size = (self.shortest_edge, int(self.shortest_edge * height / width))
+        else:
+            size = (int(self.shortest_edge * width / height), self.shortest_edge)
+        pixels = np.asarray(image.resize(size, resample=self.resample), dtype=np.float32)
+
+        # Centre crop, padding with zeros if the image is smaller than the crop
+        crop_height, crop_width = self.crop_size
+        if pixels.shape[0] < crop_height or pixels.shape[1] < crop_width:
+            padded = np.zeros((max(crop_height, pixels.shape[0]), max(crop_width, pixels.shape[1]), 3),
+                              dtype=np.float32)
+            top = (padded.shape[0] - pixels.shape[0] + 1) // 2
+            left = (padded.shape[1] - pixels.shape[1] + 1) // 2
+            padded[top:top + pixels.shape[0], left:left + pixels.shape[1]] = pixels
+            pixels = padded
+        top = (pixels.shape[0] - crop_height) // 2
+        left = (pixels.shape[1] - crop_width) // 2
+        pixels = pixels[top:top + crop_height, left:left + crop_width]
+
+        pixels = (pixels * np.float32(self.rescale_factor) - self.image_mean) / self.image_std
+        return np.ascontiguousarray(pixels.transpose(2, 0, 1))
+
+    def _tokenize(self, texts):
+        """input_ids and attention_mask int64 arrays, padded to the longest text"""
+        encodings = self.tokenizer.encode_batch([texts] if isinstance(texts, str) else list(texts))
+        return {
+            'input_ids': np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            'attention_mask': np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        }
@@ -1,7 +1,10 @@
+import time
 import numpy as np
 import pandas as pd
 from sklearn.metrics.pairwise import cosine_similarity
 from utils.color_analysis import ColorAnalyzer
+from utils.catalog import CATEGORIES, compile_catalog, item_colors
+from utils.retrieval import top_k_indices
 
 class OutfitMatcher:
     """Matches clothing items based on color and style analysis"""
@@ -14,132 +17,233 @@ class OutfitMatcher:
             'pattern_harmony': 0.2,
             'color_harmony': 0.1
         }
+        # Confidence multiplier for the overall colour harmony of an outfit
+        self.harmony_multipliers = {
+            'analogous': 1.1,
+            'complementary': 1.05,
+            'triadic': 1.0,
+            'monochromatic': 1.15,
+            'complex': 0.9
+        }
     
     def find_best_matches(self, inspiration_colors, style_features, clothing_data, threshold=0.6):
         """Find the best clothing matches for reconstructing an outfit"""
         
         # Calculate scores for each clothing item
-        scored_items = self._score_all_items(inspiration_colors, style_features, clothing_data)
+        catalog = compile_catalog(clothing_data)
+        total_scores = self.score_items(inspiration_colors, style_features, catalog)['total_score']
         
         # Select best items for each category
-        outfit = {}
-        categories = ['shirt', 'pants', 'shoes', 'jacket', 'accessory']
-        
-        for category in categories:
-            category_items = scored_items[scored_items['category'] == category]
-            
-            if not category_items.empty and category_items['total_score'].max() >= threshold:
-                best_item = category_items.loc[category_items['total_score'].idxmax()]
-                
-                outfit[category] = {
-                    'name': best_item['name'],
-                    'image_url': best_item['image_url'],
-                    'primary_color': best_item['primary_color'],
-                    'style': best_item['style'],
-                    'description': best_item['description'],
-                    'confidence': best_item['total_score']
-                }
+        outfit = self._select_best_items(catalog, total_scores, threshold)
         
         # Ensure outfit harmony
         outfit = self._optimize_outfit_harmony(outfit, inspiration_colors)
         
         return outfit
     
-    def _score_all_items(self, inspiration_colors, style_features, clothing_data):
-        """Score all clothing items against the inspiration"""
+    def find_best_matches_joint(self, inspiration_colors, style_features, clothing_data, threshold=0.6,
+                                beam_width=8, time_budget=0.05, candidates_per_category=32, harmony_weight=1.0):
+        """
+        Find the outfit that maximises its summed item scores plus the colour harmony of
+        every pair of its items, instead of taking each category's best item on its own.
+        See _search_outfit for the beam search parameters.
+        """
+        catalog = compile_catalog(clothing_data)
+        total_scores = self.score_items(inspiration_colors, style_features, catalog)['total_score']
         
-        scored_data = clothing_data.copy()
-        scores = []
+        best_rows = self._search_outfit(catalog, total_scores, threshold, beam_width,
+                                        time_budget, candidates_per_category, harmony_weight)
+        outfit = {category: self._outfit_item(catalog, total_scores, row) for category, row in best_rows.items()}
         
-        for _, item in clothing_data.iterrows():
-            # Color matching score
-            color_score = self._calculate_color_match_score(
-                inspiration_colors, 
-                self._parse_item_colors(item)
-            )
-            
-            # Style compatibility score
-            style_score = self._calculate_style_score(style_features, item)
-            
-            # Pattern harmony score
-            pattern_score = self._calculate_pattern_score(style_features, item)
+        # Ensure outfit harmony
+        outfit = self._optimize_outfit_harmony(outfit, inspiration_colors)
+        
+        return outfit
+    
+    def _select_best_items(self, catalog, total_scores, threshold):
+        """Pick the best-scoring item of each category that reaches the threshold"""
+        outfit = {}
+        
+        for category in CATEGORIES:
+            part = catalog.category_slice(category)
+            category_scores = total_scores[part]
             
-            # Color harmony score (how well it fits with other selected items)
-            harmony_score = self._calculate_harmony_score(item, inspiration_colors)
+            if len(category_scores) and category_scores.max() >= threshold:
+                best_row = part.start + np.argmax(category_scores)
+                outfit[category] = self._outfit_item(catalog, total_scores, best_row)
+        
+        return outfit
+    
+    def _outfit_item(self, catalog, total_scores, row):
+        """Outfit entry for a catalog row"""
+        item = catalog.products.iloc[row]
+        return {
+            'name': item['name'],
+            'image_url': item['image_url'],
+            'primary_color': item['primary_color'],
+            'style': item['style'],
+            'description': item['description'],
+            'confidence': total_scores[row],
+            'palette': item.get('palette')
+        }
+    
+    def _search_outfit(self, catalog, total_scores, threshold, beam_width, time_budget,
+                       candidates_per_category, harmony_weight):
+        """Beam search for the rows {category: row} of the best outfit within time_budget seconds"""
+        start = time.perf_counter()
+        
+        def over_budget():
+            return time.perf_counter() - start > time_budget
+        
+        candidates = {}
+        for category in CATEGORIES:
+            # Once over budget the remaining categories only offer their best item
+            k = 1 if over_budget() else candidates_per_category
+            part = catalog.category_slice(category)
+            category_scores = total_scores[part]
+            best = top_k_indices(category_scores, k)
+            best = best[category_scores[best] >= threshold]
+            if len(best):
+                candidates[category] = part.start + best
+        
+        pair_bonus = self._pair_bonus_tables(catalog, candidates, harmony_weight, over_budget)
+        if pair_bonus is None:
+            # The tables grow with the candidates squared; rebuild them for the best items only
+            candidates = {category: rows[:1] for category, rows in candidates.items()}
+            pair_bonus = self._pair_bonus_tables(catalog, candidates, harmony_weight)
+        categories = list(candidates)
+        
+        # beam_rows[b, i] is the candidate index chosen for categories[i] in beam state b
+        beam_rows = np.zeros((1, 0), dtype=np.intp)
+        beam_scores = np.zeros(1)
+        
+        for position, category in enumerate(categories):
+            width = 1 if over_budget() else beam_width
             
-            # Calculate weighted total score
-            total_score = (
-                color_score * self.style_weights['color_match'] +
-                style_score * self.style_weights['style_compatibility'] +
-                pattern_score * self.style_weights['pattern_harmony'] +
-                harmony_score * self.style_weights['color_harmony']
-            )
+            # Every beam state extended by every candidate of this category
+            extended = beam_scores[:, None] + total_scores[candidates[category]][None, :]
+            for previous_position, previous in enumerate(categories[:position]):
+                extended += pair_bonus[previous, category][beam_rows[:, previous_position]]
             
-            scores.append({
-                'color_score': color_score,
-                'style_score': style_score,
-                'pattern_score': pattern_score,
-                'harmony_score': harmony_score,
-                'total_score': total_score
-            })
+            best = top_k_indices(extended.ravel(), width)
+            states, picks = np.divmod(best, extended.shape[1])
+            beam_rows = np.column_stack([beam_rows[states], picks])
+            beam_scores = extended.ravel()[best]
+        
+        # top_k_indices orders the beam best first
+        return {category: candidates[category][beam_rows[0, position]]
+                for position, category in enumerate(categories)}
+    
+    def _pair_bonus_tables(self, catalog, candidates, harmony_weight, over_budget=None):
+        """
+        Harmony bonus matrices between the candidates of every two categories, or None
+        if over_budget() turns true while they are built.
+        """
+        # Each candidate's colours are counted into a hue histogram, so the bonus summed
+        # over all colour pairs of two items is hist1 @ bonus_table @ hist2.T
+        harmony_table = self.color_analyzer.hue_harmony_table()
+        bonus_table = np.zeros(harmony_table.shape)
+        for harmony, multiplier in self.harmony_multipliers.items():
+            bonus_table[harmony_table == harmony] = harmony_weight * (multiplier - 1.0)
+        hue_counts = {}
+        for category, rows in candidates.items():
+            hues = self.color_analyzer.get_hues(catalog.colors[rows].reshape(-1, 3)).reshape(len(rows), -1)
+            counts = np.zeros((len(rows), len(bonus_table)))
+            np.add.at(counts, (np.nonzero(catalog.color_mask[rows])[0], hues[catalog.color_mask[rows]]), 1)
+            hue_counts[category] = counts
+        categories = list(candidates)
+        pair_bonus = {}
+        for i, first in enumerate(categories):
+            for second in categories[i + 1:]:
+                if over_budget is not None and over_budget():
+                    return None
+                pair_count = np.outer(catalog.color_count[candidates[first]], catalog.color_count[candidates[second]])
+                pair_bonus[first, second] = hue_counts[first] @ bonus_table @ hue_counts[second].T / pair_count
+        return pair_bonus
+    
+    def _score_all_items(self, inspiration_colors, style_features, clothing_data):
+        """Score all clothing items against the inspiration"""
+        catalog = compile_catalog(clothing_data)
+        scores = self.score_items(inspiration_colors, style_features, catalog)
         
         # Add scores to dataframe
-        for key in scores[0].keys():
-            scored_data[key] = [score[key] for score in scores]
+        scored_data = catalog.products.copy()
+        for key, values in scores.items():
+            scored_data[key] = values
         
         return scored_data
     
+    def score_items(self, inspiration_colors, style_features, catalog):
+        """
+        Score every item of a CompiledCatalog against the inspiration with array operations.
+        Returns a dict of (N,) arrays; the values equal the per-item scoring methods.
+        """
+        n_items = len(catalog)
+        
+        # Color matching score: best CIE76 similarity over item x inspiration colours
+        color_score = catalog.best_color_match(inspiration_colors)
+        
+        # Style compatibility score from one table lookup per style
+        style_score = catalog.style_lookup(self._style_score_table(style_features), 0.5)
+        
+        # Pattern harmony score
+        if style_features.get('edge_density', 0) > 0.15 or style_features.get('texture_complexity', 0) > 50:
+            pattern_score = np.where(catalog.solid, 0.8, 0.6)
+        else:
+            pattern_score = np.full(n_items, 0.8)
+        
+        # Color harmony score, accumulated colour by colour in the same order as the scalar path
+        if len(inspiration_colors):
+            inspiration_temps = set(self.color_analyzer.get_color_temperatures(inspiration_colors))
+            temp_match = np.isin(catalog.color_temps, list(inspiration_temps | {'neutral'}))
+            mask = catalog.color_mask
+            
+            harmony_total = np.zeros(n_items)
+            for k in range(mask.shape[1]):
+                harmony_total = harmony_total + np.where(catalog.neutral[:, k], 0.9, 0.0)
+                harmony_total = harmony_total + np.where(mask[:, k], np.where(temp_match[:, k], 0.7, 0.4), 0.0)
+            harmony_score = np.minimum(harmony_total / catalog.color_count, 1.0)
+        else:
+            harmony_score = np.full(n_items, 0.5)
+        
+        # Calculate weighted total score
+        total_score = (
+            color_score * self.style_weights['color_match'] +
+            style_score * self.style_weights['style_compatibility'] +
+            pattern_score * self.style_weights['pattern_harmony'] +
+            harmony_score * self.style_weights['color_harmony']
+        )
+        
+        return {
+            'color_score': color_score,
+            'style_score': style_score,
+            'pattern_score': pattern_score,
+            'harmony_score': harmony_score,
+            'total_score': total_score
+        }
+    
     def _parse_item_colors(self, item):
         """Parse colors from clothing item data"""
-        # For this implementation, we'll use the primary_color and assume some secondary colors
-        primary_color = item['primary_color']
-        
-        # Map color names to RGB values
-        color_map = {
-            'black': [0, 0, 0],
-            'white': [255, 255, 255],
-            'red': [255, 0, 0],
-            'blue': [0, 0, 255],
-            'green': [0, 255, 0],
-            'yellow': [255, 255, 0],
-            'brown': [165, 42, 42],
-            'gray': [128, 128, 128],
-            'navy': [0, 0, 128],
-            'beige': [245, 245, 220],
-            'pink': [255, 192, 203],
-            'purple': [128, 0, 128],
-            'orange': [255, 165, 0],
-            'maroon': [128, 0, 0],
-            'olive': [128, 128, 0],
-            'teal': [0, 128, 128]
-        }
-        
-        rgb_color = color_map.get(primary_color.lower(), [128, 128, 128])
-        return [rgb_color]
+        return item_colors(item)
     
     def _calculate_color_match_score(self, inspiration_colors, item_colors):
         """Calculate how well item colors match inspiration colors"""
         if not item_colors or not inspiration_colors:
             return 0.0
         
-        max_similarity = 0.0
-        
         # Find the best color match
-        for item_color in item_colors:
-            for inspiration_color in inspiration_colors:
-                similarity = self.color_analyzer.calculate_color_similarity(
-                    item_color, inspiration_color
-                )
-                max_similarity = max(max_similarity, similarity)
-        
-        return max_similarity
+        similarities = self.color_analyzer.color_similarity_matrix(item_colors, inspiration_colors)
+        return float(similarities.max())
     
     def _calculate_style_score(self, style_features, item):
         """Calculate style compatibility score"""
         item_style = item['style'].lower()
-        
+        return self._style_score_table(style_features).get(item_style, 0.5)
+    
+    def _style_score_table(self, style_features):
+        """Style compatibility score of each known style for the given image features"""
         # Define style compatibility based on image features
-        style_scores = {
+        return {
             'casual': 0.8 if style_features.get('brightness', 0) > 100 else 0.6,
             'formal': 0.9 if style_features.get('contrast', 0) > 50 else 0.5,
             'business': 0.8 if style_features.get('edge_density', 0) < 0.1 else 0.6,
@@ -148,8 +252,6 @@ class OutfitMatcher:
             'trendy': 0.7,  # Neutral score for trendy items
             'classic': 0.8 if style_features.get('color_variance', 0) < 1000 else 0.6
         }
-        
-        return style_scores.get(item_style, 0.5)
     
     def _calculate_pattern_score(self, style_features, item):
         """Calculate pattern harmony score"""
@@ -175,20 +277,16 @@ class OutfitMatcher:
         # Check color harmony using color theory
         harmony_score = 0.0
         
-        for item_color in item_colors:
-            color_name = self.color_analyzer.get_color_name(item_color)
-            color_temp = self.color_analyzer.get_color_temperature(item_color)
-            
+        color_names = self.color_analyzer.get_color_names(item_colors)
+        color_temps = self.color_analyzer.get_color_temperatures(item_colors)
+        inspiration_temps = set(self.color_analyzer.get_color_temperatures(inspiration_colors))
+        
+        for color_name, color_temp in zip(color_names, color_temps):
             # Boost score for neutral colors (they go with everything)
             if color_name in ['black', 'white', 'gray', 'beige']:
                 harmony_score += 0.9
             
             # Check temperature harmony
-            inspiration_temps = [
-                self.color_analyzer.get_color_temperature(color) 
-                for color in inspiration_colors
-            ]
-            
             if color_temp in inspiration_temps or color_temp == 'neutral':
                 harmony_score += 0.7
             else:
@@ -206,7 +304,8 @@ class OutfitMatcher:
         for category, item in outfit.items():
             item_colors = self._parse_item_colors(pd.Series({
                 'primary_color': item['primary_color'],
-                'description': item['description']
+                'description': item['description'],
+                'palette': item.get('palette')
             }))
             outfit_colors.extend(item_colors)
         
@@ -214,15 +313,7 @@ class OutfitMatcher:
         harmony_type = self.color_analyzer.analyze_color_harmony(outfit_colors + inspiration_colors)
         
         # Adjust confidence scores based on overall harmony
-        harmony_multipliers = {
-            'analogous': 1.1,
-            'complementary': 1.05,
-            'triadic': 1.0,
-            'monochromatic': 1.15,
-            'complex': 0.9
-        }
-        
-        multiplier = harmony_multipliers.get(harmony_type, 1.0)
+        multiplier = self.harmony_multipliers.get(harmony_type, 1.0)
         
         for category in outfit:
             outfit[category]['confidence'] = min(
@@ -232,29 +323,44 @@ class OutfitMatcher:
         
         return outfit
     
-    def suggest_alternatives(self, outfit, clothing_data, inspiration_colors):
-        """Suggest alternative items for each category"""
+    def suggest_alternatives(self, outfit, clothing_data, inspiration_colors, k=3, style_features=None):
+        """
+        Suggest up to k alternative items for each category of an outfit.
+        Items are scored without style features unless they are given.
+        """
+        # Score all items once; each category is then a slice of the scores
+        catalog = compile_catalog(clothing_data)
+        total_scores = self.score_items(inspiration_colors, style_features or {}, catalog)['total_score']
+        
+        return self._top_alternatives(catalog, total_scores, outfit, k)
+    
+    def _top_alternatives(self, catalog, total_scores, outfit, k):
+        """Top-k items of each outfit category by score, excluding the selected item"""
         alternatives = {}
         
         for category, selected_item in outfit.items():
-            category_items = clothing_data[clothing_data['category'] == category]
+            category_items = catalog.products.iloc[catalog.category_slice(category)]
+            category_scores = total_scores[catalog.category_slice(category)]
             
-            # Score all items in this category
-            scored_items = self._score_all_items(inspiration_colors, {}, category_items)
+            names = category_items['name'].to_numpy()
             
-            # Get top 3 alternatives (excluding the selected item)
-            alternatives_list = scored_items[
-                scored_items['name'] != selected_item['name']
-            ].nlargest(3, 'total_score')
+            # Get top k alternatives (excluding the selected item); the selected item is
+            # usually among the top k + 1, so only fall back to a full scan for duplicates
+            best_rows = top_k_indices(category_scores, k + 1)
+            best_rows = best_rows[names[best_rows] != selected_item['name']][:k]
+            if len(best_rows) < k and len(best_rows) < len(names) - 1:
+                candidates = np.flatnonzero(names != selected_item['name'])
+                best_rows = candidates[top_k_indices(category_scores[candidates], k)]
             
             alternatives[category] = []
-            for _, item in alternatives_list.iterrows():
+            for row in best_rows:
+                item = category_items.iloc[row]
                 alternatives[category].append({
                     'name': item['name'],
                     'image_url': item['image_url'],
                     'primary_color': item['primary_color'],
                     'style': item['style'],
-                    'confidence': item['total_score']
+                    'confidence': category_scores[row]
                 })
         
         return alternatives
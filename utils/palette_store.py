@@ -0,0 +1,186 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from utils.color_analysis import ColorAnalyzer
+from utils.image_processing import open_image, COLOR_DECODE_SIZE
+from utils.file_store import FileHashIndex, write_json_atomic
+
+# Palette colours below this pixel share are left out of the catalog columns
+PALETTE_MIN_WEIGHT = 0.05
+
+_worker_analyzer = None
+
+
+def _init_worker(single_threaded=False):
+    """Create one ColorAnalyzer per worker process"""
+    global _worker_analyzer
+    if single_threaded:
+        # The pool already uses every core; KMeans threads per worker would oversubscribe them
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    _worker_analyzer = ColorAnalyzer()
+
+
+def _extract_file_palette(task):
+    """Worker: (path, n_colors) -> (path, colors, weights), or (path, None, None) if unreadable"""
+    path, n_colors = task
+    try:
+        with open_image(path, COLOR_DECODE_SIZE) as image:
+            palette = _worker_analyzer.extract_palette(image.convert('RGB'), n_colors=n_colors, method='fast')
+    except Exception as e:
+        print(f"Warning: Could not extract palette from {path}. Error: {e}")
+        return path, None, None
+    return path, np.asarray(palette.colors).tolist(), np.round(palette.weights, 6).tolist()
+
+
+class CatalogPaletteStore:
+    """
+    On-disk store of product image palettes keyed by image content hash.
+
+    Palettes do not depend on the CLIP model, so one JSON file per n_colors serves
+    every model. Image paths are hashed through a FileHashIndex.
+    """
+    def __init__(self, n_colors: int = 5, store_dir: str = "cache/palettes"):
+        self.n_colors = n_colors
+        self.store_dir = store_dir
+        self.path = os.path.join(store_dir, f"palettes_{n_colors}.json")
+
+        self._palettes = {}
+        self._file_hashes = FileHashIndex()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        """Load stored palettes if they exist"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self._palettes = data['palettes']
+            self._file_hashes = FileHashIndex(data['file_hashes'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Ignoring unreadable palette store {self.path}. Error: {e}")
+            self._palettes, self._file_hashes = {}, FileHashIndex()
+
+    def content_hash(self, path):
+        """Return the SHA-256 of a file's bytes, or None if it cannot be read"""
+        return self._file_hashes.content_hash(path)
+
+    def get(self, path):
+        """Return the stored palette {'colors', 'weights'} for an image path, or None"""
+        content_hash = self.content_hash(path)
+        return self._palettes.get(content_hash) if content_hash else None
+
+    def missing(self, paths):
+        """Readable image paths that have no stored palette yet, deduplicated"""
+        return [path for path in dict.fromkeys(paths)
+                if self.content_hash(path) and self.get(path) is None]
+
+    def update(self, palettes_by_path):
+        """Store palettes {path: {'colors', 'weights'}} and persist the store"""
+        for path, palette in palettes_by_path.items():
+            content_hash = self.content_hash(path)
+            if content_hash is not None:
+                self._palettes[content_hash] = palette
+                self._dirty = True
+        self.save()
+
+    def save(self):
+        """Write the store to disk atomically if anything changed"""
+        if not (self._dirty or self._file_hashes.dirty):
+            return
+        os.makedirs(self.store_dir, exist_ok=True)
+        write_json_atomic(self.path, {'palettes': self._palettes, 'file_hashes': self._file_hashes.entries})
+        self._dirty = self._file_hashes.dirty = False
+
+    def __len__(self):
+        return len(self._palettes)
+
+
+def ingest_palettes(paths, palette_store, max_workers=None, chunksize=4):
+    """
+    Extract palettes for every image in paths that the store does not have yet,
+    fanning the work out over a process pool, and persist them.
+    Returns throughput stats: images, seconds, workers, images_per_second, images_per_second_per_core.
+    """
+    missing = palette_store.missing(paths)
+    workers = max_workers or os.cpu_count() or 1
+    stats = {'images': len(missing), 'seconds': 0.0, 'workers': workers,
+             'images_per_second': 0.0, 'images_per_second_per_core': 0.0}
+    if not missing:
+        palette_store.save()
+        return stats
+
+    start = time.perf_counter()
+    tasks = [(path, palette_store.n_colors) for path in missing]
+    palettes = {}
+    if workers == 1 or len(missing) == 1:
+        # Not worth spawning processes for a single image or worker
+        _init_worker()
+        results = map(_extract_file_palette, tasks)
+        workers = 1
+    else:
+        # Spawned workers are safe to start while other threads (e.g. a model load) are running
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(True,),
+                                       mp_context=multiprocessing.get_context('spawn'))
+        results = executor.map(_extract_file_palette, tasks, chunksize=chunksize)
+
+    try:
+        for path, colors, weights in results:
+            if colors is not None:
+                palettes[path] = {'colors': colors, 'weights': weights}
+    finally:
+        if workers > 1:
+            executor.shutdown()
+
+    palette_store.update(palettes)
+    seconds = time.perf_counter() - start
+    stats.update({
+        'images': len(palettes),
+        'seconds': seconds,
+        'workers': workers,
+        'images_per_second': len(palettes) / seconds,
+        'images_per_second_per_core': len(palettes) / seconds / workers
+    })
+    return stats
+
+
+def _keep_weights(stored, min_weight):
+    """(colors, weights) of a stored palette without colours below min_weight, keeping at least the first"""
+    if stored is None:
+        return None
+    keep = [i for i, w in enumerate(stored['weights']) if w >= min_weight] or [0]
+    return [stored['colors'][i] for i in keep], [stored['weights'][i] for i in keep]
+
+
+def attach_palettes(products_df, palette_store, min_weight=PALETTE_MIN_WEIGHT):
+    """
+    Add 'palette' and 'palette_weights' columns from the store to a products table.
+    Items whose colour could not be guessed from the filename get the name of
+    their dominant palette colour as primary_color.
+    """
+    products_df = products_df.copy()
+    color_analyzer = ColorAnalyzer()
+
+    local = products_df.get('local_file', pd.Series(False, index=products_df.index)).fillna(False).astype(bool)
+    stored = products_df['image_url'].where(local).map(
+        lambda path: palette_store.get(path) if isinstance(path, str) else None
+    )
+    kept = stored.map(lambda palette: _keep_weights(palette, min_weight))
+    palettes = [palette and palette[0] for palette in kept]
+    weights = [palette and palette[1] for palette in kept]
+
+    products_df['palette'] = palettes
+    products_df['palette_weights'] = weights
+
+    unknown = products_df['primary_color'].eq('unknown') & products_df['palette'].notna()
+    if unknown.any():
+        dominant = [palette[0] for palette in products_df.loc[unknown, 'palette']]
+        products_df.loc[unknown, 'primary_color'] = color_analyzer.get_color_names(dominant)
+    return products_df
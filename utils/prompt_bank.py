@@ -0,0 +1,81 @@
+import os
+import numpy as np
+
+from utils.file_store import write_new_file
+
+
+class PromptBank:
+    """
+    Text-prompt embeddings for zero-shot labelling, encoded once and persisted.
+
+    Every label of every prompt set lives in one (L, D) matrix, so scoring a batch
+    of image embeddings against all labels is a single matrix product followed by
+    a softmax per set. The bank is saved next to the image embedding cache and is
+    tied to the model that encoded it; prompts added later are encoded on demand.
+    """
+    def __init__(self, model_name: str, prompt_sets: dict, cache_dir: str):
+        self.model_name = model_name
+        self.bank_path = os.path.join(cache_dir, "prompt_bank.npz")
+
+        self.labels = {}
+        self.slices = {}
+        self.texts = []
+        for set_name, prompts in prompt_sets.items():
+            start = len(self.texts)
+            self.labels[set_name] = list(prompts.keys())
+            self.texts.extend(prompts.values())
+            self.slices[set_name] = slice(start, len(self.texts))
+
+        self.matrix = None
+
+    def _load_stored(self):
+        """Return {text: embedding} from disk, or {} if missing or built by another model"""
+        if not os.path.exists(self.bank_path):
+            return {}
+        try:
+            with np.load(self.bank_path) as data:
+                if str(data['model_name']) != self.model_name:
+                    return {}
+                return dict(zip(data['texts'].tolist(), data['embeddings']))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Ignoring unreadable prompt bank {self.bank_path}. Error: {e}")
+            return {}
+
+    def load_or_build(self, encode_texts):
+        """
+        Fill the bank from disk, encoding any missing prompts with one batched call.
+        encode_texts takes a list of strings and returns an (N, D) normalised matrix.
+        """
+        stored = self._load_stored()
+        missing = [text for text in dict.fromkeys(self.texts) if text not in stored]
+
+        if missing:
+            stored.update(zip(missing, encode_texts(missing)))
+            bank_dir = os.path.dirname(self.bank_path)
+            os.makedirs(bank_dir, exist_ok=True)
+            tmp_name = write_new_file(bank_dir, os.path.basename(self.bank_path) + '.', '.tmp', lambda f: np.savez(
+                f,
+                model_name=np.array(self.model_name),
+                texts=np.array(list(stored.keys())),
+                embeddings=np.stack(list(stored.values())).astype(np.float32)
+            ))
+            os.replace(os.path.join(bank_dir, tmp_name), self.bank_path)
+
+        self.matrix = np.stack([stored[text] for text in self.texts]).astype(np.float32)
+        return self
+
+    def score(self, embeddings, logit_scale=100.0):
+        """
+        Score (N, D) embeddings against every label with one matrix product.
+        Returns {set_name: (labels, (N, L) softmax probabilities)}.
+        """
+        logits = logit_scale * (np.atleast_2d(embeddings) @ self.matrix.T)
+
+        results = {}
+        for set_name, label_slice in self.slices.items():
+            set_logits = logits[:, label_slice]
+            set_logits = set_logits - set_logits.max(axis=1, keepdims=True)
+            probabilities = np.exp(set_logits)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            results[set_name] = (self.labels[set_name], probabilities)
+        return results
@@ -0,0 +1,89 @@
+import numpy as np
+
+
+def cosine_scores(query, embeddings, chunk_size=65536):
+    """
+    Score every row of an (N, D) matrix of normalised embeddings against one query.
+    Scores are clipped to [0, 1] like CLIPAnalyzer.calculate_similarity.
+    Rows are processed in chunks so float16 or memory-mapped matrices are
+    upcast and paged in a block at a time.
+    """
+    query = np.asarray(query, dtype=np.float32).ravel()
+    scores = np.empty(len(embeddings), dtype=np.float32)
+
+    for start in range(0, len(embeddings), chunk_size):
+        block = np.asarray(embeddings[start:start + chunk_size], dtype=np.float32)
+        scores[start:start + len(block)] = block @ query
+
+    return np.clip(scores, 0.0, 1.0, out=scores)
+
+
+def top_k_indices(scores, k):
+    """
+    Return the indices of the k highest scores, best first.
+    Ties are broken by the lower index, so k=1 matches a first-wins scan.
+    """
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    if k < n:
+        # argpartition finds the k-th best value; keep every row tied with it
+        # so tie-breaking by index is exact and not left to the partition order
+        partition = np.argpartition(-scores, k - 1)[:k]
+        kth_score = scores[partition].min()
+        candidates = np.flatnonzero(scores >= kth_score)
+    else:
+        candidates = np.arange(n)
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
+
+
+def partition_by_category(categories):
+    """
+    Stable row order that makes every category a contiguous block.
+
+    Returns (order, {category: slice}): rows[order] lists the categories in order of
+    first appearance, and rows keep their relative order inside a category, so
+    first-wins tie-breaking on a partitioned table picks the same row as on the original.
+    """
+    categories = np.asarray(categories, dtype=object)
+    if len(categories) == 0:
+        return np.empty(0, dtype=np.intp), {}
+
+    names, first_rows, codes = np.unique(categories, return_index=True, return_inverse=True)
+    # Recode so categories are numbered by first appearance instead of sorted name
+    appearance = np.argsort(first_rows, kind='stable')
+    codes = np.argsort(appearance)[codes.ravel()]
+
+    order = np.argsort(codes, kind='stable')
+    stops = np.cumsum(np.bincount(codes, minlength=len(names)))
+    starts = stops - np.bincount(codes, minlength=len(names))
+    slices = {names[code]: slice(int(starts[i]), int(stops[i])) for i, code in enumerate(appearance)}
+    return order, slices
+
+
+def top_k_by_category_slice(query, embeddings, category_slices, k=1, category_names=None):
+    """
+    Top-k rows per category of a category-partitioned matrix (see partition_by_category).
+
+    Only the rows of the requested categories are scored, each as one contiguous block,
+    so no per-category mask is built. Returns {category: (row_indices, scores)} with
+    rows indexing the whole matrix, sorted best first; categories without rows are omitted.
+    """
+    if category_names is None:
+        category_names = list(category_slices)
+
+    results = {}
+    for category in category_names:
+        part = category_slices.get(category)
+        if part is None or part.stop <= part.start:
+            continue
+
+        scores = cosine_scores(query, embeddings[part])
+        best = top_k_indices(scores, k)
+        results[category] = (best + part.start, scores[best])
+
+    return results
@@ -2,7 +2,8 @@ import numpy as np
 import pandas as pd
 from sklearn.metrics.pairwise import cosine_similarity
 from utils.color_analysis import ColorAnalyzer
-from utils.image_processing import ImageProcessor
+from utils.catalog import CATEGORIES, compile_catalog, item_colors
+from utils.image_processing import ImageProcessor, COLOR_DECODE_SIZE
 
 class StyleMatcher:
     """Enhanced matching system that uses style references to guide outfit creation"""
@@ -18,29 +19,47 @@ class StyleMatcher:
             'color_harmony': 0.05
         }
         self.style_reference_cache = {}
+        
+        # How well each item style fits each reference style type
+        self.style_compatibility_map = {
+            'formal': {'formal': 1.0, 'business': 0.8, 'elegant': 0.9, 'evening': 0.7},
+            'business': {'business': 1.0, 'formal': 0.8, 'smart_casual': 0.7, 'classic': 0.8},
+            'casual': {'casual': 1.0, 'smart_casual': 0.6, 'sporty': 0.7, 'trendy': 0.8},
+            'smart_casual': {'smart_casual': 1.0, 'business': 0.7, 'casual': 0.6, 'elegant': 0.6},
+            'sporty': {'sporty': 1.0, 'casual': 0.7, 'trendy': 0.6},
+            'elegant': {'elegant': 1.0, 'formal': 0.9, 'evening': 0.8, 'classic': 0.7},
+            'evening': {'evening': 1.0, 'formal': 0.7, 'elegant': 0.8}
+        }
     
     def load_style_references(self, style_references):
         """Preprocess and cache style reference data"""
         self.style_reference_cache = {}
+        loaded = []
         
         for ref in style_references:
             try:
                 from utils.image_loader import ImageLoader
                 image_loader = ImageLoader()
-                ref_image = image_loader.get_image_from_path(ref['path'])
+                ref_image = image_loader.get_image_from_path(ref['path'], draft_size=COLOR_DECODE_SIZE)
                 
                 if ref_image:
-                    # Extract features from reference
+                    # Extract colours from reference; style features are batched below
                     colors = self.color_analyzer.extract_dominant_colors(ref_image, n_colors=5)
-                    style_features = self.image_processor.extract_style_features(ref_image)
-                    
-                    self.style_reference_cache[ref['style_type']] = {
-                        'colors': colors,
-                        'features': style_features,
-                        'name': ref['name']
-                    }
+                    loaded.append((ref, colors, self.image_processor.stack_images([ref_image])[0]))
             except Exception as e:
                 print(f"Error processing style reference {ref['name']}: {e}")
+        
+        if not loaded:
+            return
+        
+        # Style features of every reference in one vectorised pass
+        features = self.image_processor.extract_style_features_batch(np.stack([image for _, _, image in loaded]))
+        for row, (ref, colors, _) in enumerate(loaded):
+            self.style_reference_cache[ref['style_type']] = {
+                'colors': colors,
+                'features': {key: values[row] for key, values in features.items()},
+                'name': ref['name']
+            }
     
     def find_best_matches_with_references(self, inspiration_colors, style_features, 
                                         clothing_data, style_references, threshold=0.6):
@@ -53,12 +72,13 @@ class StyleMatcher:
         best_reference_style = self._find_best_reference_style(inspiration_colors, style_features)
         
         # Calculate scores for each clothing item
-        scored_items = self._score_all_items_with_references(
-            inspiration_colors, style_features, clothing_data, best_reference_style
+        catalog = compile_catalog(clothing_data)
+        scores = self.score_items_with_references(
+            inspiration_colors, style_features, catalog, best_reference_style
         )
         
         # Select best items for each category using enhanced logic
-        outfit = self._select_outfit_items(scored_items, threshold, best_reference_style)
+        outfit = self._select_outfit_items(catalog, scores, threshold, best_reference_style)
         
         # Final harmony optimization
         outfit = self._optimize_outfit_with_references(outfit, inspiration_colors, best_reference_style)
@@ -102,13 +122,8 @@ class StyleMatcher:
         if not colors1 or not colors2:
             return 0.0
         
-        similarities = []
-        for color1 in colors1:
-            max_sim = 0
-            for color2 in colors2:
-                sim = self.color_analyzer.calculate_color_similarity(color1, color2)
-                max_sim = max(max_sim, sim)
-            similarities.append(max_sim)
+        # Best match in colors2 for each color in colors1
+        similarities = self.color_analyzer.color_similarity_matrix(colors1, colors2).max(axis=1)
         
         return np.mean(similarities)
     
@@ -136,47 +151,70 @@ class StyleMatcher:
     def _score_all_items_with_references(self, inspiration_colors, style_features, 
                                        clothing_data, best_reference):
         """Score items considering style references"""
-        scored_data = clothing_data.copy()
-        scores = []
-        
-        for _, item in clothing_data.iterrows():
-            # Original scoring components
-            color_score = self._calculate_color_match_score(
-                inspiration_colors, self._parse_item_colors(item)
-            )
-            style_score = self._calculate_style_score(style_features, item)
-            pattern_score = self._calculate_pattern_score(style_features, item)
-            harmony_score = self._calculate_harmony_score(item, inspiration_colors)
-            
-            # NEW: Reference alignment score
-            reference_score = self._calculate_reference_alignment_score(
-                item, best_reference
-            )
-            
-            # Calculate weighted total score
-            total_score = (
-                color_score * self.style_weights['color_match'] +
-                style_score * self.style_weights['style_compatibility'] +
-                reference_score * self.style_weights['reference_alignment'] +
-                pattern_score * self.style_weights['pattern_harmony'] +
-                harmony_score * self.style_weights['color_harmony']
-            )
-            
-            scores.append({
-                'color_score': color_score,
-                'style_score': style_score,
-                'reference_score': reference_score,
-                'pattern_score': pattern_score,
-                'harmony_score': harmony_score,
-                'total_score': total_score
-            })
+        catalog = compile_catalog(clothing_data)
+        scores = self.score_items_with_references(inspiration_colors, style_features, catalog, best_reference)
         
         # Add scores to dataframe
-        for key in scores[0].keys():
-            scored_data[key] = [score[key] for score in scores]
+        scored_data = catalog.products.copy()
+        for key, values in scores.items():
+            scored_data[key] = values
         
         return scored_data
     
+    def score_items_with_references(self, inspiration_colors, style_features, catalog, best_reference):
+        """
+        Score every item of a CompiledCatalog with array operations.
+        Returns a dict of (N,) arrays; the values equal the per-item scoring methods.
+        """
+        n_items = len(catalog)
+        
+        # Original scoring components
+        color_score = catalog.best_color_match(inspiration_colors)
+        style_score = catalog.style_lookup(self._style_score_table(style_features), 0.5)
+        
+        if style_features.get('edge_density', 0) > 0.15 or style_features.get('texture_complexity', 0) > 50:
+            pattern_score = np.where(catalog.solid, 0.8, 0.6)
+        else:
+            pattern_score = np.full(n_items, 0.8)
+        
+        if len(inspiration_colors):
+            harmony_total = np.zeros(n_items)
+            for k in range(catalog.color_mask.shape[1]):
+                harmony_total = harmony_total + np.where(
+                    catalog.color_mask[:, k], np.where(catalog.neutral[:, k], 0.9, 0.6), 0.0
+                )
+            harmony_score = np.minimum(harmony_total / catalog.color_count, 1.0)
+        else:
+            harmony_score = np.full(n_items, 0.5)
+        
+        # NEW: Reference alignment score
+        if best_reference:
+            color_alignment = catalog.mean_color_match(best_reference['data']['colors'])
+            style_alignment = catalog.style_lookup(
+                self.style_compatibility_map.get(best_reference['style_type'], {}), 0.3
+            )
+            reference_score = (color_alignment * 0.6) + (style_alignment * 0.4)
+        else:
+            reference_score = np.full(n_items, 0.5)  # Neutral score if no reference
+        
+        # Calculate weighted total score
+        total_score = (
+            color_score * self.style_weights['color_match'] +
+            style_score * self.style_weights['style_compatibility'] +
+            reference_score * self.style_weights['reference_alignment'] +
+            pattern_score * self.style_weights['pattern_harmony'] +
+            harmony_score * self.style_weights['color_harmony']
+        )
+        
+        return {
+            'color_score': color_score,
+            'style_score': style_score,
+            'reference_score': reference_score,
+            'pattern_score': pattern_score,
+            'harmony_score': harmony_score,
+            'total_score': total_score
+        }
+    
     def _calculate_reference_alignment_score(self, item, best_reference):
         """Calculate how well an item aligns with the best reference style"""
         if not best_reference:
@@ -194,57 +232,32 @@ class StyleMatcher:
         item_style = item['style'].lower()
         ref_style_type = best_reference['style_type']
         
-        style_compatibility_map = {
-            'formal': {'formal': 1.0, 'business': 0.8, 'elegant': 0.9, 'evening': 0.7},
-            'business': {'business': 1.0, 'formal': 0.8, 'smart_casual': 0.7, 'classic': 0.8},
-            'casual': {'casual': 1.0, 'smart_casual': 0.6, 'sporty': 0.7, 'trendy': 0.8},
-            'smart_casual': {'smart_casual': 1.0, 'business': 0.7, 'casual': 0.6, 'elegant': 0.6},
-            'sporty': {'sporty': 1.0, 'casual': 0.7, 'trendy': 0.6},
-            'elegant': {'elegant': 1.0, 'formal': 0.9, 'evening': 0.8, 'classic': 0.7},
-            'evening': {'evening': 1.0, 'formal': 0.7, 'elegant': 0.8}
-        }
-        
-        style_score = style_compatibility_map.get(ref_style_type, {}).get(item_style, 0.3)
+        style_score = self.style_compatibility_map.get(ref_style_type, {}).get(item_style, 0.3)
         
         # Combined alignment score
         return (color_alignment * 0.6) + (style_score * 0.4)
     
     def _parse_item_colors(self, item):
         """Parse colors from clothing item data"""
-        primary_color = item['primary_color']
-        
-        color_map = {
-            'black': [0, 0, 0], 'white': [255, 255, 255], 'red': [255, 0, 0],
-            'blue': [0, 0, 255], 'green': [0, 255, 0], 'yellow': [255, 255, 0],
-            'brown': [165, 42, 42], 'gray': [128, 128, 128], 'navy': [0, 0, 128],
-            'beige': [245, 245, 220], 'pink': [255, 192, 203], 'purple': [128, 0, 128],
-            'orange': [255, 165, 0], 'maroon': [128, 0, 0], 'olive': [128, 128, 0],
-            'teal': [0, 128, 128]
-        }
-        
-        rgb_color = color_map.get(primary_color.lower(), [128, 128, 128])
-        return [rgb_color]
+        return item_colors(item)
     
     def _calculate_color_match_score(self, inspiration_colors, item_colors):
         """Calculate color matching score"""
         if not item_colors or not inspiration_colors:
             return 0.0
         
-        max_similarity = 0.0
-        for item_color in item_colors:
-            for inspiration_color in inspiration_colors:
-                similarity = self.color_analyzer.calculate_color_similarity(
-                    item_color, inspiration_color
-                )
-                max_similarity = max(max_similarity, similarity)
-        
-        return max_similarity
+        # Find the best color match
+        similarities = self.color_analyzer.color_similarity_matrix(item_colors, inspiration_colors)
+        return float(similarities.max())
     
     def _calculate_style_score(self, style_features, item):
         """Calculate style compatibility score"""
         item_style = item['style'].lower()
-        
-        style_scores = {
+        return self._style_score_table(style_features).get(item_style, 0.5)
+    
+    def _style_score_table(self, style_features):
+        """Style compatibility score of each known style for the given image features"""
+        return {
             'casual': 0.8 if style_features.get('brightness', 0) > 100 else 0.6,
             'formal': 0.9 if style_features.get('contrast', 0) > 50 else 0.5,
             'business': 0.8 if style_features.get('edge_density', 0) < 0.1 else 0.6,
@@ -253,8 +266,6 @@ class StyleMatcher:
             'trendy': 0.7,
             'classic': 0.8 if style_features.get('color_variance', 0) < 1000 else 0.6
         }
-        
-        return style_scores.get(item_style, 0.5)
     
     def _calculate_pattern_score(self, style_features, item):
         """Calculate pattern harmony score"""
@@ -274,9 +285,7 @@ class StyleMatcher:
             return 0.5
         
         harmony_score = 0.0
-        for item_color in item_colors:
-            color_name = self.color_analyzer.get_color_name(item_color)
-            
+        for color_name in self.color_analyzer.get_color_names(item_colors):
             if color_name in ['black', 'white', 'gray', 'beige']:
                 harmony_score += 0.9
             else:
@@ -284,30 +293,29 @@ class StyleMatcher:
         
         return min(harmony_score / len(item_colors), 1.0)
     
-    def _select_outfit_items(self, scored_items, threshold, best_reference):
+    def _select_outfit_items(self, catalog, scores, threshold, best_reference):
         """Select best items for outfit with reference-aware logic"""
         outfit = {}
-        categories = ['shirt', 'pants', 'shoes', 'jacket', 'accessory']
+        total_scores = scores['total_score']
         
-        for category in categories:
-            category_items = scored_items[scored_items['category'] == category]
+        for category in CATEGORIES:
+            part = catalog.category_slice(category)
+            category_scores = total_scores[part]
             
-            if not category_items.empty:
-                # Filter by threshold
-                valid_items = category_items[category_items['total_score'] >= threshold]
+            # Filter by threshold
+            if len(category_scores) and category_scores.max() >= threshold:
+                best_row = part.start + np.argmax(category_scores)
+                best_item = catalog.products.iloc[best_row]
                 
-                if not valid_items.empty:
-                    best_item = valid_items.loc[valid_items['total_score'].idxmax()]
-                    
-                    outfit[category] = {
-                        'name': best_item['name'],
-                        'image_url': best_item['image_url'],
-                        'primary_color': best_item['primary_color'],
-                        'style': best_item['style'],
-                        'description': best_item['description'],
-                        'confidence': best_item['total_score'],
-                        'reference_score': best_item.get('reference_score', 0)
-                    }
+                outfit[category] = {
+                    'name': best_item['name'],
+                    'image_url': best_item['image_url'],
+                    'primary_color': best_item['primary_color'],
+                    'style': best_item['style'],
+                    'description': best_item['description'],
+                    'confidence': total_scores[best_row],
+                    'reference_score': scores['reference_score'][best_row]
+                }
         
         return outfit
     